@@ -1,72 +1,38 @@
-from flask import Flask, render_template, jsonify, request, session, redirect, url_for
+from flask import Flask, Response, render_template, jsonify, request, session, redirect, url_for
 from database import * 
-from blockchain import mine_block, validate_chain, calculate_difficulty 
-from smart_contracts import validate_contract, create_contract 
+from blockchain import validate_chain_parallel
+from smart_contracts import create_contract 
+from mempool import admit
+from order_book import engine
+from mining_jobs import MiningQueue, mine_pending_blocks
+from merkle import hash_leaf, merkle_proof
+from chain_cache import chain_cache
+from stats import get_stats
+from events import broker
+import metrics
 import json
+import math
 import secrets
 import os 
 
 # --- 1. Define the Flask app instance FIRST ---
 app = Flask(__name__)
 
+# Per-route latency histograms (and opt-in cProfile dumps, see metrics.PROFILE_DIR)
+metrics.instrument_app(app)
+
 # --- 2. Set the secret key for the app ---
 app.secret_key = os.environ.get("FLASK_SECRET_KEY", secrets.token_hex(16)) 
 
-# --- 3. Initialize the database (depends on app context for some operations, or just creates tables) ---
-init_db()
-
-# In-memory lists (these don't strictly depend on 'app' being defined yet, but good to place after init)
-pending_txs = [] 
-smart_contracts = [] 
-
-# --- 4. Define the initial transaction processing function ---
-# This function is defined here, but not called yet.
-def process_initial_pending_transactions():
-    """
-    Checks the database for any transactions marked 'pending' (e.g., from initial user generation).
-    If found, it mines them into a new block by the 'system' user to establish initial balances.
-    This runs once when the Flask app starts.
-    """
-    global pending_txs 
-
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("SELECT seller, buyer, energy, price FROM transactions WHERE status='pending'")
-    db_pending_txs = [{"seller": r[0], "buyer": r[1], "energy": r[2], "price": r[3]} for r in c.fetchall()]
-    conn.close()
-
-    if db_pending_txs:
-        print(f"Found {len(db_pending_txs)} initial pending transactions. Mining them into a block...")
-        
-        miner = "system" 
-        blocks = get_all_blocks() 
-        difficulty = calculate_difficulty(len(blocks)) 
-        
-        block = mine_block(db_pending_txs, miner, len(blocks), 
-                           blocks[-1]["hash"] if blocks else "0", difficulty)
-        
-        add_block(block["index"], block["hash"], miner, json.dumps(block["data"]), difficulty)
-        
-        conn = sqlite3.connect(DB_NAME)
-        c = conn.cursor()
-        for tx in db_pending_txs:
-            c.execute("UPDATE transactions SET status='confirmed' WHERE seller=? AND buyer=? AND energy=? AND price=? AND status='pending'",
-                      (tx["seller"], tx["buyer"], tx["energy"], tx["price"]))
-        conn.commit()
-        conn.close()
-        
-        print(f"Initial block {block['index']} mined by {miner} containing {len(db_pending_txs)} transactions.")
-        
-        pending_txs.clear() 
-    else:
-        print("No initial pending transactions to process.")
-
-# --- 5. Call the initial transaction processing function within the app context ---
-# This ensures that if any database operations within it require Flask's app context, they have it.
-with app.app_context():
-    process_initial_pending_transactions()
-
-# --- 6. Define all your routes (these use 'app' as a decorator) ---
+# --- 3. Make sure the schema is current ---
+# Creating tables and mining the initial allocations is a one-off job for
+# bootstrap.py (gunicorn runs it once in the master before forking workers),
+# so importing the app stays cheap. This only catches a server started
+# without it, and never mines.
+if get_schema_version() < len(MIGRATIONS):
+    init_db()
+
+# --- 4. Define all your routes (these use 'app' as a decorator) ---
 @app.route("/")
 def home():
     # ... (rest of your home route code) ...
@@ -106,77 +72,225 @@ def admin():
         return redirect(url_for("home"))
     return render_template("admin.html")
 
+def _tx_error(tx):
+    """Why a submitted trade can't be validated at all, or None if it's well formed"""
+    if not isinstance(tx, dict):
+        return "Transaction must be an object"
+    for field in ("seller", "buyer"):
+        if not isinstance(tx.get(field), str):
+            return f"Missing or invalid {field}"
+    for field in ("energy", "price", "fee"):
+        value = tx.get(field, 0) if field == "fee" else tx.get(field)
+        # Flask's JSON parser accepts NaN and Infinity, which no balance can be compared against
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+            return f"Missing or invalid {field}"
+    if tx.get("fee", 0) < 0:
+        return "Fee cannot be negative"
+    return None
+
 @app.route("/add_tx", methods=["POST"])
 def add_tx():
     if "user" not in session:
         return jsonify({"error": "Not logged in"}), 401
     
-    tx = request.json
-    tx["initiator"] = session["user"]
+    tx = request.get_json(silent=True)
+    error = _tx_error(tx)
+    if error:
+        return jsonify({"error": error}), 400
     
-    contract_valid, msg = validate_contract(tx, get_user_balance(tx["seller"]))
+    [(contract_valid, msg, tx_id)] = admit([tx])
     if not contract_valid:
         return jsonify({"error": msg}), 400
     
-    add_transaction(tx["seller"], tx["buyer"], tx["energy"], tx["price"], "pending")
-    pending_txs.append(tx) 
-    
-    return jsonify({"status": "added", "message": msg})
+    return jsonify({"status": "added", "message": msg, "id": tx_id})
 
-@app.route("/create_contract", methods=["POST"])
-def create_contract_route():
+MAX_BATCH_TXS = 10000
+
+@app.route("/add_tx/batch", methods=["POST"])
+def add_tx_batch():
+    """
+    Submit many trades at once, as a JSON array of {seller, buyer, energy, price[, fee]}.
+    The whole batch is validated against one balance snapshot (earlier trades in
+    the batch count against later ones) and accepted trades are inserted in one
+    transaction. Returns a result per item, in submission order.
+    """
     if "user" not in session:
         return jsonify({"error": "Not logged in"}), 401
     
-    contract = request.json
-    contract["creator"] = session["user"]
-    contract_id = create_contract(contract)
-    smart_contracts.append(contract)
+    txs = request.get_json(silent=True)
+    if not isinstance(txs, list):
+        return jsonify({"error": "Expected a JSON array of transactions"}), 400
+    if len(txs) > MAX_BATCH_TXS:
+        return jsonify({"error": f"At most {MAX_BATCH_TXS} transactions per batch"}), 400
     
-    return jsonify({"status": "created", "id": contract_id})
+    results = [None] * len(txs)
+    well_formed = []
+    for i, tx in enumerate(txs):
+        error = _tx_error(tx)
+        if error:
+            results[i] = {"index": i, "status": "rejected", "error": error}
+        else:
+            well_formed.append(i)
+    
+    added = 0
+    for i, (valid, msg, tx_id) in zip(well_formed, admit([txs[i] for i in well_formed])):
+        if valid:
+            added += 1
+            results[i] = {"index": i, "status": "added", "message": msg, "id": tx_id}
+        else:
+            results[i] = {"index": i, "status": "rejected", "error": msg}
+    
+    return jsonify({"added": added, "rejected": len(txs) - added, "results": results})
 
-@app.route("/mine", methods=["POST"])
-def mine():
+@app.route("/orders", methods=["GET", "POST"])
+def orders():
+    """
+    GET: the logged-in user's orders, newest first.
+    POST {side: "bid"|"ask", price: <$/kWh>, quantity: <kWh>}: place a limit
+    order; it is matched immediately and any remainder rests in the book.
+    """
     if "user" not in session:
         return jsonify({"error": "Not logged in"}), 401
+    if request.method == "GET":
+        return jsonify(get_user_orders(session["user"]))
+    
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Expected a JSON object"}), 400
+    for field in ("price", "quantity"):
+        value = data.get(field)
+        # As in _tx_error: the JSON parser lets NaN and Infinity through
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+            return jsonify({"error": f"Missing or invalid {field}"}), 400
     
-    miner = session["user"]
-    blocks = get_all_blocks()
-    difficulty = calculate_difficulty(len(blocks))
+    try:
+        order, fills = engine.submit(session["user"], data.get("side"), data["price"], data["quantity"])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"order": order, "fills": fills})
+
+@app.route("/orders/<int:order_id>", methods=["DELETE"])
+def cancel_order(order_id):
+    if "user" not in session:
+        return jsonify({"error": "Not logged in"}), 401
     
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("SELECT seller, buyer, energy, price FROM transactions WHERE status='pending'")
-    txs_to_mine = [{"seller": r[0], "buyer": r[1], "energy": r[2], "price": r[3]} for r in c.fetchall()]
-    conn.close()
+    order = engine.cancel(order_id, session["user"])
+    if order is None:
+        return jsonify({"error": "No such open order"}), 404
+    return jsonify({"status": "cancelled", "order": order})
+
+@app.route("/orderbook")
+def orderbook():
+    try:
+        levels = int(request.args.get("levels", 10))
+    except ValueError:
+        return jsonify({"error": "levels must be an integer"}), 400
+    return jsonify(engine.depth(min(max(levels, 1), 100)))
 
-    if not txs_to_mine:
-        return jsonify({"error": "No pending transactions to mine."}), 400
+@app.route("/create_contract", methods=["POST"])
+def create_contract_route():
+    if "user" not in session:
+        return jsonify({"error": "Not logged in"}), 401
+    
+    contract = request.get_json(silent=True)
+    if not isinstance(contract, dict):
+        return jsonify({"error": "Expected a JSON object"}), 400
+    contract["creator"] = session["user"]
+    
+    # Users may bind their own trades; contracts covering anyone else need an admin
+    if session.get("role") != "admin" and session["user"] not in (contract.get("seller"), contract.get("buyer")):
+        return jsonify({"error": "Only admins can create contracts binding other users"}), 403
+    
+    try:
+        contract_id = create_contract(contract)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    return jsonify({"status": "created", "id": contract_id})
 
-    block = mine_block(txs_to_mine, miner, len(blocks), 
-                       blocks[-1]["hash"] if blocks else "0", difficulty)
+def verify_stored_chain(full=False):
+    """
+    Validates the stored chain. Normally only blocks above the persisted
+    checkpoint are checked; full=True (or a missing or stale checkpoint)
+    re-verifies everything above the trusted base (genesis, or the last block
+    mined before full headers were stored). A valid result moves the
+    checkpoint to the current tip.
+    """
+    checkpoint = None if full else get_chain_checkpoint()
+    if checkpoint is not None and get_block_hash(checkpoint[0]) != checkpoint[1]:
+        print(f"Checkpoint block {checkpoint[0]} no longer matches its recorded hash, re-verifying the whole chain")
+        checkpoint = None
     
-    add_block(block["index"], block["hash"], miner, json.dumps(block["data"]), difficulty)
+    # Always validate what was persisted, never the in-memory cache: the point
+    # is to catch blocks that were stored differently from how they were mined.
+    # Above a checkpoint that is only the few most recent blocks.
+    base = get_trusted_base()
+    # Only blocks at or below the recorded base may lack a nonce; a stored block
+    # above it without one was edited after it was mined
+    unverifiable = get_unverifiable_block_above(base[0])
+    if unverifiable is not None:
+        clear_chain_checkpoint()
+        return False, f"Block {unverifiable} has no proof of work above the trusted base"
     
-    reward = 10 * difficulty
+    start = checkpoint if checkpoint is not None else base
+    blocks = get_blocks_after(start[0])
+    with metrics.chain_validation_seconds.time(mode="incremental" if checkpoint else "full"):
+        is_valid, message = validate_chain_parallel(blocks, prev_hash=start[1])
+    metrics.chain_validated_blocks.inc(len(blocks))
     
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    for tx in txs_to_mine:
-        c.execute("UPDATE transactions SET status='confirmed' WHERE seller=? AND buyer=? AND energy=? AND price=? AND status='pending'",
-                  (tx["seller"], tx["buyer"], tx["energy"], tx["price"]))
-    conn.commit()
-    conn.close()
+    if not is_valid:
+        clear_chain_checkpoint()
+    elif blocks:
+        set_chain_checkpoint(blocks[-1]["index"], blocks[-1]["hash"])
+    return is_valid, message
+
+def mine_pending(miner):
+    """
+    Mines every pending transaction into the next blocks for miner.
+    Runs on the mining queue's background thread, never inside a request.
+    """
+    mined = mine_pending_blocks(miner)
+    if not mined:
+        return {"error": "No pending transactions to mine."}
     
-    pending_txs.clear() 
+    block = mined[-1]
+    reward = sum(10 * b["difficulty"] + sum(tx.get("fee", 0) for tx in b["data"]) for b in mined)
+    summary = "Block mined!" if len(mined) == 1 else f"{len(mined)} blocks mined!"
 
-    all_blocks_after_mine = get_all_blocks()
-    is_valid, validation_msg = validate_chain(all_blocks_after_mine)
+    is_valid, validation_msg = verify_stored_chain()
     if not is_valid:
         print(f"CRITICAL ERROR: Chain became invalid after mining! {validation_msg}")
-        return jsonify({"message": f"Block mined! Reward: ${reward}. WARNING: Chain invalid after mine: {validation_msg}", "block": block, "chain_valid": False}), 500
+        return {"error": f"{summary} Reward: ${reward}. WARNING: Chain invalid after mine: {validation_msg}", "block": block, "chain_valid": False}
+
+    return {"message": f"{summary} Reward: ${reward}", "block": block, "blocks": [b["index"] for b in mined], "chain_valid": True}
+
+mining_queue = MiningQueue(mine_pending)
+
+@app.route("/mine", methods=["POST"])
+def mine():
+    if "user" not in session:
+        return jsonify({"error": "Not logged in"}), 401
+    
+    c = get_connection().cursor()
+    c.execute("SELECT COUNT(*) FROM transactions WHERE status='pending'")
+    pending_tx_count = c.fetchone()[0]
 
-    return jsonify({"message": f"Block mined! Reward: ${reward}", "block": block, "chain_valid": True})
+    if not pending_tx_count:
+        return jsonify({"error": "No pending transactions to mine."}), 400
+
+    job, coalesced = mining_queue.submit(session["user"])
+    message = "Joined the mining job already queued" if coalesced else "Mining job queued"
+    return jsonify({"status": job["status"], "job_id": job["id"], "coalesced": coalesced, "message": message}), 202
+
+@app.route("/mine/<job_id>")
+def mine_status(job_id):
+    if "user" not in session:
+        return jsonify({"error": "Not logged in"}), 401
+    
+    job = mining_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown mining job"}), 404
+    return jsonify(job)
 
 @app.route("/balance/<user>")
 def balance(user):
@@ -188,26 +302,145 @@ def my_balance():
         return jsonify({"error": "Not logged in"}), 401
     return jsonify(get_user_balance(session["user"]))
 
+CHAIN_PAGE_SIZE = 100
+CHAIN_MAX_PAGE_SIZE = 1000
+
 @app.route("/chain")
 def get_chain():
-    return jsonify(get_all_blocks())
+    """
+    /chain                          every block as one JSON array (streamed)
+    /chain?after=<index>&limit=<n>  one page: {"blocks": [...], "next_after": <index or null>}
+    /chain?format=ndjson            one block per line, streamed; accepts after/limit too
+    """
+    try:
+        after = int(request.args["after"]) if "after" in request.args else None
+        limit = int(request.args["limit"]) if "limit" in request.args else None
+    except ValueError:
+        return jsonify({"error": "after and limit must be integers"}), 400
+    if limit is not None and limit < 1:
+        return jsonify({"error": "limit must be positive"}), 400
+
+    if request.args.get("format") == "ndjson":
+        blocks = iter_blocks_json(after, limit)
+        return Response((block + "\n" for _, block in blocks), mimetype="application/x-ndjson")
+
+    if after is None and limit is None:
+        def stream_array():
+            yield "["
+            for i, (_, block) in enumerate(iter_blocks_json()):
+                yield block if i == 0 else "," + block
+            yield "]"
+        return Response(stream_array(), mimetype="application/json")
+
+    limit = min(limit or CHAIN_PAGE_SIZE, CHAIN_MAX_PAGE_SIZE)
+    # Fetch one extra block to learn whether another page follows
+    page = list(iter_blocks_json(after, limit + 1))
+    next_after = page[limit - 1][0] if len(page) > limit else None
+    body = '{"blocks": [%s], "next_after": %s}' % (",".join(block for _, block in page[:limit]), json.dumps(next_after))
+    return Response(body, mimetype="application/json")
+
+@app.route("/tx/<int:tx_id>/proof")
+def tx_proof(tx_id):
+    """
+    Merkle inclusion proof for a confirmed transaction. A client holding the
+    block header (hash and merkle_root) can check it with merkle.verify_proof
+    without downloading the block's other transactions.
+    """
+    block_id = get_transaction_block_id(tx_id)
+    if block_id is None:
+        return jsonify({"error": "Transaction not found in any block"}), 404
+    
+    block = chain_cache.get_block(block_id)
+    if block["merkle_root"] is None:
+        return jsonify({"error": f"Block {block_id} predates Merkle commitments"}), 404
+    
+    position = next(i for i, tx in enumerate(block["data"]) if tx.get("id") == tx_id)
+    tx = block["data"][position]
+    return jsonify({
+        "tx": tx,
+        "block_index": block["index"],
+        "block_hash": block["hash"],
+        "merkle_root": block["merkle_root"],
+        "leaf_hash": hash_leaf(tx),
+        "position": position,
+        "proof": merkle_proof(block["data"], position)
+    })
 
 @app.route("/transactions")
 def transactions():
     return jsonify(get_all_transactions())
 
+TRADES_PAGE_SIZE = 50
+TRADES_MAX_PAGE_SIZE = 500
+
+@app.route("/users/<name>/trades")
+def user_trades(name):
+    """
+    One page of a user's confirmed trades, newest first:
+    {"trades": [...], "next_before": <cursor or null>}. Pass next_before back
+    as ?before= for the following page.
+    """
+    if "user" not in session:
+        return jsonify({"error": "Not logged in"}), 401
+    if session["user"] != name and session.get("role") != "admin":
+        return jsonify({"error": "Unauthorized"}), 403
+    
+    try:
+        # The cursor is the last trade's "<block>:<position>"
+        before = tuple(int(part) for part in request.args["before"].split(":")) if "before" in request.args else None
+        limit = int(request.args.get("limit", TRADES_PAGE_SIZE))
+    except ValueError:
+        return jsonify({"error": "before must be <block>:<position> and limit an integer"}), 400
+    if before is not None and len(before) != 2:
+        return jsonify({"error": "before must be <block>:<position>"}), 400
+    if limit < 1:
+        return jsonify({"error": "limit must be positive"}), 400
+    
+    limit = min(limit, TRADES_MAX_PAGE_SIZE)
+    # Fetch one extra trade to learn whether another page follows
+    trades = get_user_trades(name, before, limit + 1)
+    last = trades[limit - 1] if len(trades) > limit else None
+    return jsonify({"trades": trades[:limit],
+                    "next_before": f"{last['block_id']}:{last['position']}" if last else None})
+
+VOLUME_MAX_BUCKETS = 1000
+
+@app.route("/analytics/volume")
+def analytics_volume():
+    """
+    Confirmed trading volume per hour or day (UTC):
+    /analytics/volume?bucket=hour|day[&since=<epoch>][&until=<epoch>][&limit=<n>]
+    Each bucket has its energy (kWh), VWAP price per kWh and trade count.
+    """
+    bucket = request.args.get("bucket", "hour")
+    if bucket not in VOLUME_BUCKETS:
+        return jsonify({"error": f"bucket must be one of: {', '.join(VOLUME_BUCKETS)}"}), 400
+    try:
+        since = float(request.args["since"]) if "since" in request.args else None
+        until = float(request.args["until"]) if "until" in request.args else None
+        limit = int(request.args.get("limit", 100))
+    except ValueError:
+        return jsonify({"error": "since and until must be timestamps and limit an integer"}), 400
+    if limit < 1:
+        return jsonify({"error": "limit must be positive"}), 400
+    
+    buckets = get_volume(bucket, since, until, min(limit, VOLUME_MAX_BUCKETS))
+    return jsonify({"bucket": bucket, "buckets": [
+        {"start": b["start"], "energy": b["energy"], "trades": b["trades"],
+         "vwap_price_per_kwh": round(b["value"] / b["energy"], 6) if b["energy"] else None}
+        for b in buckets]})
+
 @app.route("/pending")
 def pending():
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("SELECT seller, buyer, energy, price, timestamp FROM transactions WHERE status='pending' ORDER BY timestamp DESC")
-    db_pending_txs = [{"seller": r[0], "buyer": r[1], "energy": r[2], "price": r[3], "timestamp": r[4]} for r in c.fetchall()]
-    conn.close()
+    c = get_connection().cursor()
+    c.execute("SELECT seller, buyer, energy, price, fee, timestamp FROM transactions WHERE status='pending' ORDER BY timestamp DESC")
+    db_pending_txs = [{"seller": r[0], "buyer": r[1], "energy": r[2], "price": r[3], "fee": r[4], "timestamp": r[5]} for r in c.fetchall()]
     return jsonify(db_pending_txs)
 
 @app.route("/contracts")
 def contracts():
-    return jsonify(smart_contracts)
+    # ?seller=<user> / ?buyer=<user> narrow to the contracts binding that party
+    return jsonify(get_contracts(seller=request.args.get("seller"), buyer=request.args.get("buyer")))
 
 @app.route("/users")
 def users():
@@ -215,37 +448,64 @@ def users():
         return jsonify({"error": "Unauthorized"}), 403
     return jsonify(get_all_users())
 
+@app.route("/events")
+def events():
+    """
+    Server-Sent Events feed of "block", "pending_tx" and "balances" events
+    for the dashboards. Browsers resume after a reconnect via Last-Event-ID.
+    Every open stream holds a request thread, so each worker only keeps
+    events.MAX_SUBSCRIBERS of them; past that this answers 503 and the
+    dashboards switch to /events/poll.
+    """
+    if "user" not in session:
+        return jsonify({"error": "Not logged in"}), 401
+    
+    last_event_id = request.headers.get("Last-Event-ID", type=int)
+    subscription = broker.subscribe(last_event_id)
+    if subscription is None:
+        return jsonify({"error": "Too many live connections, poll /events/poll instead"}), 503
+    return Response(subscription, mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+EVENTS_POLL_LIMIT = 1000
+
+@app.route("/events/poll")
+def events_poll():
+    """
+    The same events for clients without a stream: {"events": [...], "last_id": n}.
+    Call without ?after= to learn where the log ends, then pass last_id back.
+    """
+    if "user" not in session:
+        return jsonify({"error": "Not logged in"}), 401
+    
+    after = request.args.get("after", type=int)
+    if after is None:
+        return jsonify({"events": [], "last_id": get_last_event_id()})
+    events = get_events_after(after, EVENTS_POLL_LIMIT)
+    return jsonify({"events": events, "last_id": events[-1]["id"] if events else after})
+
 @app.route("/stats")
 def stats():
-    blocks = get_all_blocks()
-    txs = get_all_transactions()
-    users_list = get_all_users()
-    
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("SELECT COUNT(*) FROM transactions WHERE status='pending'")
-    pending_tx_count = c.fetchone()[0]
-    conn.close()
+    return jsonify(get_stats())
 
-    return jsonify({
-        "total_blocks": len(blocks),
-        "total_transactions": len(txs),
-        "total_users": len(users_list),
-        "pending_txs": pending_tx_count,
-        "avg_difficulty": sum(b.get("difficulty", 2) for b in blocks) / len(blocks) if blocks else 0,
-        "total_contracts": len(smart_contracts)
-    })
+@app.route("/metrics")
+def metrics_endpoint():
+    """Prometheus scrape target for this worker's request, database, mining and validation metrics"""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
 
 @app.route("/validate_blockchain_server", methods=["GET"])
 def validate_blockchain_server():
     if "user" not in session or session.get("role") != "admin":
         return jsonify({"error": "Unauthorized"}), 403
     
-    blocks = get_all_blocks()
-    is_valid, message = validate_chain(blocks)
+    # ?full=1 ignores the checkpoint and re-verifies every block
+    full = request.args.get("full") in ("1", "true")
+    is_valid, message = verify_stored_chain(full=full)
     
-    return jsonify({"is_valid": is_valid, "message": message})
+    return jsonify({"is_valid": is_valid, "message": message, "full": full})
 
-# --- 7. Main execution block (for local development) ---
+# --- 5. Main execution block (for local development) ---
 if __name__ == "__main__":
+    from bootstrap import bootstrap
+    bootstrap()
     app.run(host='0.0.0.0', port=os.environ.get('PORT', 5000), debug=False)
@@ -0,0 +1,85 @@
+"""
+Moves the transaction JSON of blocks more than a configurable depth below the
+tip out of SQLite into zlib-compressed segment files (see segments.py).
+Headers, hashes, the ledger and the rollups stay in SQLite; the database reads
+archived bodies back from their segments whenever a block is loaded, so
+/chain, proofs and validation don't change.
+
+Run it periodically, e.g. from cron:
+    python archive.py --depth 10000
+
+Freed pages are reused by new blocks, so the database stops growing; pass
+--vacuum to also shrink the file (this rewrites it and blocks writers while
+it runs).
+"""
+import argparse
+import os
+
+import database
+from segments import SegmentWriter
+
+# Blocks this close to the tip keep their bodies in SQLite, where recent blocks are read most
+ARCHIVE_DEPTH = int(os.environ.get("ARCHIVE_DEPTH", 10000))
+# Bodies moved per SQLite transaction
+BATCH_SIZE = 1000
+
+LOCK_NAME = "archive"
+LOCK_TTL = 60
+
+
+def archive_blocks(depth=ARCHIVE_DEPTH, batch_size=BATCH_SIZE):
+    """
+    Archive the bodies of every block at least depth below the tip that is
+    still in SQLite. Returns how many were moved, or None if another process
+    holds the archive lock.
+    """
+    owner = database.new_lock_owner()
+    if not database.acquire_lock(LOCK_NAME, owner, LOCK_TTL):
+        return None
+
+    archived = 0
+    writer = None
+    try:
+        tip = database.get_chain_tip()
+        max_height = tip["index"] - depth if tip else -1
+        after = -1
+        while True:
+            bodies = database.get_hot_bodies(max_height, after, batch_size)
+            if not bodies:
+                break
+            if writer is None:
+                writer = SegmentWriter(database.get_archive_dir())
+            entries = [(block_id, *writer.append(data.encode())) for block_id, data in bodies]
+            # Records must be durable before the index points at them
+            writer.sync()
+            database.archive_bodies(entries)
+            archived += len(entries)
+            after = bodies[-1][0]
+            if not database.renew_lock(LOCK_NAME, owner, LOCK_TTL):
+                print("Lost the archive lock, stopping.")
+                break
+    finally:
+        if writer is not None:
+            writer.close()
+        database.release_lock(LOCK_NAME, owner)
+    return archived
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--depth", type=int, default=ARCHIVE_DEPTH, help="blocks below the tip to keep in SQLite")
+    parser.add_argument("--vacuum", action="store_true", help="shrink the database file afterwards")
+    args = parser.parse_args()
+
+    database.init_db()
+    archived = archive_blocks(args.depth)
+    if archived is None:
+        print("Another process is archiving, try again later.")
+        return
+    print(f"Archived {archived} block bodies to {database.get_archive_dir()}")
+    if args.vacuum and archived:
+        database.get_connection().execute("VACUUM")
+
+
+if __name__ == "__main__":
+    main()
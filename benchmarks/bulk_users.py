@@ -0,0 +1,45 @@
+"""
+Bulk provisioning throughput: synthetic users plus their pending initial
+allocations through generate_users.bulk_load into a fresh database.
+
+Run from the repository root:
+    python -m benchmarks.bulk_users --users 1000000
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import database
+import generate_users
+
+
+def run(num_users, batch_size):
+    with tempfile.TemporaryDirectory(prefix="pyblock-bench-") as workdir:
+        database.DB_NAME = os.path.join(workdir, "bulk.db")
+        database.init_db()
+
+        start = time.perf_counter()
+        totals = generate_users.bulk_load(generate_users.generate_user_rows(num_users), batch_size)
+        elapsed = time.perf_counter() - start
+
+    return {
+        "users": totals["users"],
+        "allocations": totals["allocations"],
+        "batch_size": batch_size,
+        "seconds": round(elapsed, 2),
+        "users_per_sec": round(totals["users"] / elapsed) if elapsed else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000000)
+    parser.add_argument("--batch-size", type=int, default=generate_users.BATCH_SIZE)
+    args = parser.parse_args()
+    print(json.dumps(run(args.users, args.batch_size), indent=2))
+
+
+if __name__ == "__main__":
+    main()
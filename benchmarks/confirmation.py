@@ -0,0 +1,100 @@
+"""
+Confirming a bootstrap-sized block of pending transactions: the original
+per-transaction UPDATE matched on (seller, buyer, energy, price), against the
+original unindexed transactions table, versus one executemany keyed on the
+primary key.
+
+Run from the repository root:
+    python -m benchmarks.confirmation --users 1000
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+import database
+import generate_users
+
+
+def build_bootstrap_db(path, num_users):
+    database.DB_NAME = path
+    database.init_db()
+    with contextlib.redirect_stdout(io.StringIO()):
+        generate_users.generate_users(num_users, "1234")
+
+
+def drop_transaction_indexes(conn):
+    # The baseline schema had no secondary indexes on transactions, so each
+    # legacy UPDATE was a table scan; the later seller/buyer indexes would
+    # otherwise turn it into an index probe and hide the difference
+    names = [r[0] for r in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type='index' AND tbl_name='transactions' AND sql IS NOT NULL")]
+    for name in names:
+        conn.execute(f"DROP INDEX {name}")
+    conn.commit()
+
+
+def legacy_confirm(path, txs):
+    conn = sqlite3.connect(path)
+    drop_transaction_indexes(conn)
+    c = conn.cursor()
+    start = time.perf_counter()
+    for tx in txs:
+        c.execute("UPDATE transactions SET status='confirmed' WHERE seller=? AND buyer=? AND energy=? AND price=? AND status='pending'",
+                  (tx["seller"], tx["buyer"], tx["energy"], tx["price"]))
+    conn.commit()
+    elapsed = time.perf_counter() - start
+    conn.close()
+    return elapsed
+
+
+def batched_confirm(path, txs):
+    database.DB_NAME = path
+    start = time.perf_counter()
+    with database.transaction():
+        database.confirm_transactions([tx["id"] for tx in txs], 1)
+    return time.perf_counter() - start
+
+
+def run(num_users):
+    workdir = tempfile.mkdtemp(prefix="pyblock-bench-")
+    try:
+        base = os.path.join(workdir, "base.db")
+        build_bootstrap_db(base, num_users)
+        database.DB_NAME = base
+        txs = database.get_pending_transactions()
+        # Fold the WAL into the main file so the copies below see every row
+        database.get_connection().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+        legacy_db = os.path.join(workdir, "legacy.db")
+        batched_db = os.path.join(workdir, "batched.db")
+        shutil.copy(base, legacy_db)
+        shutil.copy(base, batched_db)
+
+        legacy = legacy_confirm(legacy_db, txs)
+        batched = batched_confirm(batched_db, txs)
+        return {
+            "users": num_users,
+            "pending_transactions": len(txs),
+            "legacy_seconds": round(legacy, 4),
+            "batched_seconds": round(batched, 4),
+            "speedup": round(legacy / batched, 1) if batched else None
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000)
+    args = parser.parse_args()
+    print(json.dumps(run(args.users), indent=2))
+
+
+if __name__ == "__main__":
+    main()
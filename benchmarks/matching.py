@@ -0,0 +1,82 @@
+"""
+Order matching throughput: marketable orders per second against a book of
+resting orders, each fill admitted to the pending pool. Also times reloading
+the book from its SQLite snapshot, as a restarted worker would.
+
+Run from the repository root:
+    python -m benchmarks.matching --resting 10000 --orders 2000
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+import database
+from order_book import MatchingEngine, OrderBook
+
+
+def seed_balances(traders, energy):
+    # Give every trader enough confirmed energy to back their asks
+    with database.transaction() as c:
+        c.executemany("INSERT INTO balances (username, energy, currency, mining_rewards) VALUES (?, ?, 0, 0)",
+                      [(name, energy) for name in traders])
+
+
+def run(resting, orders, traders, seed):
+    rng = random.Random(seed)
+    with tempfile.TemporaryDirectory(prefix="pyblock-bench-") as workdir:
+        database.DB_NAME = os.path.join(workdir, "matching.db")
+        database.init_db()
+        names = [f"trader_{i:04d}" for i in range(traders)]
+        seed_balances(names, 1e9)
+        engine = MatchingEngine()
+
+        # A book that doesn't cross: bids below $5/kWh, asks above
+        start = time.perf_counter()
+        for i in range(resting):
+            side = "bid" if i % 2 else "ask"
+            price = round(rng.uniform(1, 4.99) if side == "bid" else rng.uniform(5.01, 10), 2)
+            engine.submit(rng.choice(names), side, price, rng.randint(50, 500))
+        place_elapsed = time.perf_counter() - start
+
+        # Small marketable orders, so the book stays close to its resting size
+        fills = 0
+        start = time.perf_counter()
+        for i in range(orders):
+            side = "bid" if i % 2 else "ask"
+            _, order_fills = engine.submit(rng.choice(names), side, 10 if side == "bid" else 0.01, rng.randint(1, 20))
+            fills += len(order_fills)
+        match_elapsed = time.perf_counter() - start
+        open_orders = len(engine.book.orders)
+
+        start = time.perf_counter()
+        OrderBook(database.get_open_orders())
+        reload_elapsed = time.perf_counter() - start
+
+    return {
+        "resting_orders": resting,
+        "resting_orders_per_sec": round(resting / place_elapsed),
+        "marketable_orders": orders,
+        "fills": fills,
+        "matched_orders_per_sec": round(orders / match_elapsed),
+        "fills_per_sec": round(fills / match_elapsed),
+        "open_orders_after": open_orders,
+        "snapshot_reload_seconds": round(reload_elapsed, 4)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--resting", type=int, default=10000)
+    parser.add_argument("--orders", type=int, default=2000, help="marketable orders to match against the book")
+    parser.add_argument("--traders", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(json.dumps(run(args.resting, args.orders, args.traders, args.seed), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Hashes/sec comparison between the original single-threaded mining loop and
+the midstate/multi-process engine in blockchain.mine_block.
+
+Run from the repository root:
+    python -m benchmarks.mining --difficulties 2,3,4,5,6 --txs 100
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+
+from blockchain import hash_block, mine_block
+
+
+def legacy_mine_block(data, miner, index, prev_hash, difficulty, max_seconds):
+    # The pre-engine loop: rebuild, re-serialize and re-timestamp every attempt
+    nonce = 0
+    start_time = time.time()
+
+    while time.time() - start_time < max_seconds:
+        block = {
+            "index": index,
+            "timestamp": time.time(),
+            "data": data,
+            "prev": prev_hash,
+            "nonce": nonce,
+            "miner": miner,
+            "difficulty": difficulty
+        }
+        h = hash_block(block)
+        if h.startswith("0" * difficulty):
+            return nonce + 1, time.time() - start_time, True
+        nonce += 1
+
+    return nonce, time.time() - start_time, False
+
+
+def synthetic_txs(count):
+    return [{"seller": "system", "buyer": f"prosumer_{i:04d}", "energy": round(1 + i * 0.37, 2),
+             "price": round(2 + i * 0.11, 2)} for i in range(count)]
+
+
+def run(difficulties, tx_count, workers, max_seconds):
+    data = synthetic_txs(tx_count)
+    prev_hash = hashlib.sha256(b"benchmark").hexdigest()
+    results = []
+
+    for difficulty in difficulties:
+        attempts, elapsed, solved = legacy_mine_block(data, "bench", 1, prev_hash, difficulty, max_seconds)
+        legacy_rate = attempts / elapsed if elapsed else 0
+
+        block = mine_block(data, "bench", 1, prev_hash, difficulty, workers=workers)
+        assert hash_block(block) == block["hash"]
+        # Workers stride the nonce space, so the winning nonce approximates the total attempts
+        engine_rate = (block["nonce"] + 1) / block["mining_time"] if block["mining_time"] else 0
+
+        results.append({
+            "difficulty": difficulty,
+            "legacy_hashes_per_sec": round(legacy_rate),
+            "legacy_solved": solved,
+            "engine_hashes_per_sec": round(engine_rate),
+            "engine_seconds": round(block["mining_time"], 4),
+            "speedup": round(engine_rate / legacy_rate, 2) if legacy_rate else None
+        })
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--difficulties", default="2,3,4,5,6")
+    parser.add_argument("--txs", type=int, default=100, help="transactions per block")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--max-seconds", type=float, default=30,
+                        help="time budget for each legacy run; the rate is still reported if it runs out")
+    args = parser.parse_args()
+
+    difficulties = [int(d) for d in args.difficulties.split(",")]
+    print(json.dumps(run(difficulties, args.txs, args.workers, args.max_seconds), indent=2))
+
+
+if __name__ == "__main__":
+    main()
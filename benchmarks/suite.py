@@ -0,0 +1,291 @@
+"""
+End-to-end benchmark suite for comparing commits. For each scale it builds a
+synthetic database (users and initial allocations through generate_users,
+then trade blocks up to the requested chain length), times the hot
+functions, and drives the Flask app through its test client with concurrent
+/add_tx, /mine, /stats and /chain traffic. Everything is seeded, so two runs
+of the same scale see the same data; results are printed as one JSON
+document, optionally compared against an earlier run.
+
+Run from the repository root:
+    python -m benchmarks.suite --scales 1000:1000,100000:50000 --output before.json
+    python -m benchmarks.suite --scales 1000:1000,100000:50000 --compare before.json
+"""
+import argparse
+import concurrent.futures
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import database
+import generate_users
+from blockchain import hash_block, mine_block, split_into_blocks, validate_chain
+
+# Difficulty for the synthetic blocks, low so that building 50k of them stays quick
+BUILD_DIFFICULTY = 1
+# Synthetic blocks committed per transaction while building
+BUILD_COMMIT_EVERY = 1000
+TXS_PER_TRADE_BLOCK = 5
+
+# Relative weights of each route in the load test
+LOAD_MIX = {"add_tx": 60, "stats": 25, "chain": 14, "mine": 1}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def usernames(role):
+    c = database.get_connection().cursor()
+    c.execute("SELECT username FROM users WHERE role=? ORDER BY id", (role,))
+    return [r[0] for r in c.fetchall()]
+
+
+def build_db(path, num_users, num_blocks, seed):
+    """Fresh database at path with num_users users and (at least) num_blocks blocks"""
+    random.seed(seed)  # generate_user_rows draws from the global generator
+    rng = random.Random(seed)
+    database.DB_NAME = path
+    database.init_db()
+    with contextlib.redirect_stdout(io.StringIO()):
+        generate_users.bulk_load(generate_users.generate_user_rows(num_users), generate_users.BATCH_SIZE)
+
+    producers, consumers = usernames("producer") or ["system"], usernames("consumer") or ["admin"]
+    # Allocation blocks first, as bootstrap.py would mine them, then trades
+    batches = split_into_blocks(database.get_pending_transactions())
+    tip = database.get_chain_tip()
+    height, prev_hash = tip["index"] + 1, tip["hash"]
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        while height < num_blocks or batches:
+            with database.transaction():
+                for _ in range(BUILD_COMMIT_EVERY):
+                    if batches:
+                        txs = batches.pop(0)
+                    elif height < num_blocks:
+                        txs = []
+                        for _ in range(TXS_PER_TRADE_BLOCK):
+                            energy = rng.randint(1, 5)
+                            txs.append({"seller": rng.choice(producers), "buyer": rng.choice(consumers),
+                                        "energy": energy, "price": round(energy * rng.uniform(1, 10), 2)})
+                    else:
+                        break
+                    block = mine_block(txs, "system", height, prev_hash, BUILD_DIFFICULTY, workers=1)
+                    database.add_block(block)
+                    ids = [tx["id"] for tx in txs if "id" in tx]
+                    if ids:
+                        database.confirm_transactions(ids, height)
+                    height, prev_hash = height + 1, block["hash"]
+
+    database.get_connection().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return height
+
+
+def prepare_db(workdir, cache_dir, num_users, num_blocks, seed):
+    """Path to a working copy of the scale's database, reusing cache_dir's copy when it has one"""
+    path = os.path.join(workdir, f"suite-{num_users}u-{num_blocks}b.db")
+    if cache_dir:
+        cached = os.path.join(cache_dir, f"suite-{num_users}u-{num_blocks}b-seed{seed}-v{len(database.MIGRATIONS)}.db")
+        if not os.path.exists(cached):
+            os.makedirs(cache_dir, exist_ok=True)
+            build_db(cached + ".tmp", num_users, num_blocks, seed)
+            os.replace(cached + ".tmp", cached)
+        shutil.copy(cached, path)
+        database.DB_NAME = path
+    else:
+        build_db(path, num_users, num_blocks, seed)
+    return path
+
+
+def summarize(durations):
+    durations = sorted(durations)
+    return {
+        "calls": len(durations),
+        "median_seconds": round(statistics.median(durations), 7),
+        "p95_seconds": round(durations[min(len(durations) - 1, int(len(durations) * 0.95))], 7),
+        "total_seconds": round(sum(durations), 4)
+    }
+
+
+def time_calls(fn, repeat):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - start)
+    return summarize(durations)
+
+
+def micro_benchmarks(rng, repeat):
+    users = usernames("producer") + usernames("consumer")
+    blocks = database.get_all_blocks()
+    sample_block = max(blocks, key=lambda b: len(b["data"]))
+    base = database.get_trusted_base()
+    stored = database.get_blocks_after(base[0])
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        return {
+            "hash_block": time_calls(lambda: hash_block(sample_block), repeat * 10),
+            "mine_block_difficulty_3": time_calls(
+                lambda: mine_block(sample_block["data"], "bench", 1, "0" * 64, 3, workers=1), max(repeat // 10, 3)),
+            "validate_chain": dict(time_calls(lambda: validate_chain(stored, prev_hash=base[1]), 3),
+                                   blocks=len(stored)),
+            "get_user_balance": time_calls(lambda: database.get_user_balance(rng.choice(users)), repeat * 10),
+            "get_all_blocks": dict(time_calls(database.get_all_blocks, 3), blocks=len(blocks)),
+        }
+
+
+def load_test(rng, requests, threads, mine_timeout):
+    import app as app_module  # imported only once DB_NAME points at the benchmark database
+    import stats
+    stats._cached = None  # the /stats cache isn't keyed by database
+
+    producers, consumers = usernames("producer"), usernames("consumer")
+    tip = database.get_chain_tip()["index"]
+    routes = [route for route, weight in LOAD_MIX.items() for _ in range(weight)]
+    plan = [(rng.choice(routes), rng.random()) for _ in range(requests)]
+
+    def client():
+        c = app_module.app.test_client()
+        with c.session_transaction() as session:
+            session["user"], session["role"] = "bench", "admin"
+        return c
+
+    def worker(chunk):
+        c = client()
+        samples = []
+        for route, r in chunk:
+            start = time.perf_counter()
+            if route == "add_tx":
+                energy = 1 + int(r * 5)
+                response = c.post("/add_tx", json={"seller": producers[int(r * len(producers))],
+                                                   "buyer": consumers[int(r * 7919) % len(consumers)],
+                                                   "energy": energy, "price": round(energy * (1 + r * 9), 2)})
+            elif route == "stats":
+                response = c.get("/stats")
+            elif route == "chain":
+                response = c.get(f"/chain?after={int(r * tip)}&limit=100")
+            else:
+                response = c.post("/mine")
+            response.get_data()
+            samples.append((route, response.status_code, time.perf_counter() - start,
+                            response.get_json(silent=True) if route == "mine" else None))
+        return samples
+
+    chunks = [plan[i::threads] for i in range(threads)]
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as pool:
+        samples = [s for chunk_samples in pool.map(worker, chunks) for s in chunk_samples]
+    elapsed = time.perf_counter() - start
+
+    result = {"requests": requests, "threads": threads, "seconds": round(elapsed, 3),
+              "requests_per_sec": round(requests / elapsed, 1), "routes": {}}
+    for route in LOAD_MIX:
+        route_samples = [s for s in samples if s[0] == route]
+        if route_samples:
+            statuses = {}
+            for _, status, _, _ in route_samples:
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+            result["routes"][route] = dict(summarize([s[2] for s in route_samples]), statuses=statuses)
+
+    # Let queued mining finish so the next scale starts from a quiet database
+    job_ids = {s[3]["job_id"] for s in samples if s[3] and "job_id" in s[3]}
+    start = time.perf_counter()
+    while job_ids and time.perf_counter() - start < mine_timeout:
+        job_ids = {job_id for job_id in job_ids
+                   if app_module.mining_queue.get(job_id)["status"] not in ("done", "failed")}
+        time.sleep(0.1)
+    result["mining_drain_seconds"] = round(time.perf_counter() - start, 3) if not job_ids else None
+    return result
+
+
+def run(scales, seed, repeat, requests, threads, cache_dir, mine_timeout):
+    results = []
+    with tempfile.TemporaryDirectory(prefix="pyblock-suite-") as workdir:
+        for num_users, num_blocks in scales:
+            rng = random.Random(seed)
+            start = time.perf_counter()
+            prepare_db(workdir, cache_dir, num_users, num_blocks, seed)
+            build_seconds = time.perf_counter() - start
+
+            scale = {"users": num_users, "blocks": database.get_chain_tip()["index"] + 1,
+                     "build_seconds": round(build_seconds, 2)}
+            scale["micro"] = micro_benchmarks(rng, repeat)
+            scale["load"] = load_test(rng, requests, threads, mine_timeout)
+            results.append(scale)
+    return results
+
+
+def compare(baseline, current, path=""):
+    """{metric path: {"baseline", "current", "ratio"}} for every timing or rate present in both runs"""
+    out = {}
+    if isinstance(baseline, dict) and isinstance(current, dict):
+        for key in baseline.keys() & current.keys():
+            out.update(compare(baseline[key], current[key], f"{path}.{key}" if path else key))
+    elif (isinstance(baseline, (int, float)) and isinstance(current, (int, float)) and baseline
+          and path.endswith(("_seconds", "_per_sec"))):
+        out[path] = {"baseline": baseline, "current": current, "ratio": round(current / baseline, 3)}
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", default="1000:1000,100000:50000", help="comma-separated users:blocks pairs")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=100, help="base repetition count for micro-benchmarks")
+    parser.add_argument("--requests", type=int, default=2000, help="requests per load test")
+    parser.add_argument("--threads", type=int, default=8, help="concurrent test clients")
+    parser.add_argument("--mine-timeout", type=float, default=300, help="seconds to wait for queued mining after a load test")
+    parser.add_argument("--cache-dir", help="keep built databases here and reuse them on later runs")
+    parser.add_argument("--output", help="also write the JSON results to this file")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    scales = [tuple(int(n) for n in scale.split(":")) for scale in args.scales.split(",")]
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "cpu_count": os.cpu_count(),
+            "started_at": time.time(),
+            "args": vars(args)
+        },
+    }
+    # The app and mine_block print progress; keep stdout for the JSON report
+    with contextlib.redirect_stdout(sys.stderr):
+        report["scales"] = run(scales, args.seed, args.repeat, args.requests, args.threads, args.cache_dir,
+                               args.mine_timeout)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = {(scale["users"], scale["blocks"]): scale for scale in json.load(f)["scales"]}
+        # Only scales present in both runs are comparable
+        report["comparison"] = {}
+        for scale in report["scales"]:
+            if (scale["users"], scale["blocks"]) in baseline:
+                report["comparison"].update(compare(baseline[(scale["users"], scale["blocks"])], scale,
+                                                    f"{scale['users']}u:{scale['blocks']}b"))
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Full validate_chain pass, the same pass sharded across a process pool
+(validate_chain_parallel), and the incremental check run after each new
+block (only the blocks above the verified checkpoint), on a synthetic chain.
+
+Run from the repository root:
+    python -m benchmarks.validation --blocks 10000,20000 --workers 8
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import time
+
+from blockchain import mine_block, validate_chain, validate_chain_parallel
+
+
+def build_chain(length, txs_per_block=5, difficulty=2):
+    blocks = [{"index": 0, "hash": "genesis", "miner": "system", "data": [], "difficulty": 1}]
+    # mine_block prints two lines per block
+    with contextlib.redirect_stdout(io.StringIO()):
+        for index in range(1, length):
+            data = [{"seller": f"producer_{index % 97:04d}", "buyer": f"consumer_{(index + j) % 89:04d}",
+                     "energy": 1 + j, "price": 2 + j} for j in range(txs_per_block)]
+            blocks.append(mine_block(data, "bench", index, blocks[-1]["hash"], difficulty, workers=1))
+    return blocks
+
+
+def run(lengths, txs_per_block, workers):
+    results = []
+    for length in lengths:
+        blocks = build_chain(length, txs_per_block)
+
+        start = time.perf_counter()
+        full_valid, _ = validate_chain(blocks)
+        full = time.perf_counter() - start
+
+        start = time.perf_counter()
+        parallel_valid, _ = validate_chain_parallel(blocks, workers=workers)
+        parallel = time.perf_counter() - start
+
+        # What mining does after appending one block on top of the checkpoint
+        start = time.perf_counter()
+        incremental_valid, _ = validate_chain(blocks[-1:], prev_hash=blocks[-2]["hash"])
+        incremental = time.perf_counter() - start
+
+        assert full_valid and parallel_valid and incremental_valid
+        results.append({
+            "blocks": length,
+            "workers": workers,
+            "full_seconds": round(full, 4),
+            "parallel_seconds": round(parallel, 4),
+            "parallel_speedup": round(full / parallel, 2) if parallel else None,
+            "incremental_seconds": round(incremental, 6),
+            "incremental_speedup": round(full / incremental) if incremental else None
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--blocks", default="10000")
+    parser.add_argument("--txs", type=int, default=5, help="transactions per block")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+    print(json.dumps(run([int(n) for n in args.blocks.split(",")], args.txs, args.workers), indent=2))
+
+
+if __name__ == "__main__":
+    main()
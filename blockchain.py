@@ -1,6 +1,19 @@
+import concurrent.futures
 import hashlib
 import time
 import json
+import multiprocessing
+import os
+import queue
+import threading
+
+import metrics
+from merkle import merkle_root
+
+
+# Caps for a single block; a larger pending pool is split over several blocks
+MAX_BLOCK_TXS = int(os.environ.get("MAX_BLOCK_TXS", 500))
+MAX_BLOCK_BYTES = int(os.environ.get("MAX_BLOCK_BYTES", 256 * 1024))
 
 
 def calculate_difficulty(block_count):
@@ -8,68 +21,285 @@ def calculate_difficulty(block_count):
     return min(2 + block_count // 5, 6)
 
 
+def _hashed_fields(block):
+    # Blocks with a merkle_root commit to their transactions through it, so only
+    # the fixed-size header is hashed. Older blocks hash their full data list.
+    skip = {"hash", "mining_time"}
+    if block.get("merkle_root") is not None:
+        skip.add("data")
+    return {k: v for k, v in block.items() if k not in skip}
+
+
 def hash_block(block):
-    # Create a copy to avoid modifying the original dictionary
-    block_copy = {k: v for k, v in block.items() if k != "hash" and k != "mining_time"}
     # Sort keys to ensure consistent hashing
-    encoded_block = json.dumps(block_copy, sort_keys=True).encode()
+    encoded_block = json.dumps(_hashed_fields(block), sort_keys=True).encode()
     return hashlib.sha256(encoded_block).hexdigest()
 
 
-def mine_block(data, miner, index, prev_hash, difficulty):
-    nonce = 0
+def split_into_blocks(txs, max_txs=None, max_bytes=None):
+    # Drain txs in order into successive batches capped by count and serialized size.
+    # A single transaction larger than max_bytes still gets a block of its own.
+    max_txs = max_txs or MAX_BLOCK_TXS
+    max_bytes = max_bytes or MAX_BLOCK_BYTES
+    batches = []
+    batch, batch_bytes = [], 2  # the enclosing "[]"
+
+    for tx in txs:
+        tx_bytes = len(json.dumps(tx)) + 2  # plus the ", " separator
+        if batch and (len(batch) >= max_txs or batch_bytes + tx_bytes > max_bytes):
+            batches.append(batch)
+            batch, batch_bytes = [], 2
+        batch.append(tx)
+        batch_bytes += tx_bytes
+
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+# Placeholder spliced out of the serialized header so only the nonce changes per attempt
+NONCE_MARKER = "\x00nonce\x00"
+
+# Below this difficulty the expected work is too small to be worth starting processes
+PARALLEL_MIN_DIFFICULTY = 4
+
+# How many nonces a worker tries between checks of the shared "found" flag
+CHECK_INTERVAL = 4096
+
+# Give up on a parallel search after this many seconds rather than hang the mining thread
+MINING_TIMEOUT = float(os.environ.get("MINING_TIMEOUT", 600))
+
+# Worker processes for mining and validation are started from a clean forkserver
+# (spawn where that's unavailable) rather than forked: the caller is a thread in
+# a multi-threaded server, and a forked child could inherit locks held by other
+# threads mid-operation and deadlock.
+_mp = multiprocessing.get_context("forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+
+
+def _forget_forkserver():
+    # A process forked after the forkserver started (a gunicorn worker, when
+    # bootstrap mined in the master) inherits the handle to a server that isn't
+    # its child and fails on first use; drop it so a fresh one starts on demand
+    from multiprocessing import forkserver
+    server = forkserver._forkserver
+    if server._forkserver_alive_fd is not None:
+        os.close(server._forkserver_alive_fd)
+    server._forkserver_address = server._forkserver_alive_fd = server._forkserver_pid = None
+    server._lock = threading.Lock()
+
+
+if _mp.get_start_method() == "forkserver":
+    os.register_at_fork(after_in_child=_forget_forkserver)
+
+
+def split_block_encoding(block):
+    # Serialize the block exactly as hash_block does, but with a marker in place of
+    # the nonce, so callers can hash prefix + str(nonce) + suffix for any nonce
+    block_copy = _hashed_fields(block)
+    block_copy["nonce"] = NONCE_MARKER
+    encoded_block = json.dumps(block_copy, sort_keys=True).encode()
+    parts = encoded_block.split(json.dumps(NONCE_MARKER).encode())
+    if len(parts) != 2:
+        raise ValueError("Nonce marker found in block data")
+    return parts[0], parts[1]
+
+
+def search_nonce(prefix, suffix, difficulty, start=0, step=1, found=None):
+    # Hash the prefix once and reuse its midstate for every nonce
+    target = "0" * difficulty
+    midstate = hashlib.sha256(prefix)
+    nonce = start
+
+    while True:
+        for _ in range(CHECK_INTERVAL):
+            h = midstate.copy()
+            h.update(b"%d" % nonce + suffix)
+            digest = h.hexdigest()
+            if digest.startswith(target):
+                return nonce, digest
+            nonce += step
+
+        if found is not None and found.is_set():
+            return None
+
+
+def _pow_worker(prefix, suffix, difficulty, start, step, found, results):
+    result = search_nonce(prefix, suffix, difficulty, start, step, found)
+    if result is not None:
+        found.set()
+        results.put(result)
+
+
+def _parallel_search(prefix, suffix, difficulty, workers):
+    # Each worker takes every workers-th nonce; the first one to succeed
+    # raises the shared flag and the rest stop at their next check
+    found = _mp.Event()
+    results = _mp.Queue()
+    procs = [_mp.Process(target=_pow_worker, args=(prefix, suffix, difficulty, i, workers, found, results), daemon=True)
+             for i in range(workers)]
+    for p in procs:
+        p.start()
+
+    deadline = time.monotonic() + MINING_TIMEOUT
+    try:
+        while True:
+            try:
+                result = results.get(timeout=1)
+                break
+            except queue.Empty:
+                # A worker that died (OOM-killed, say) never reports, so don't wait on it forever
+                if not any(p.is_alive() for p in procs) and results.empty():
+                    raise RuntimeError("Every proof-of-work worker exited without a result")
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"No proof of work found within {MINING_TIMEOUT:.0f}s")
+    finally:
+        found.set()
+        for p in procs:
+            p.join(timeout=1)
+            if p.is_alive():
+                p.terminate()
+    return result
+
+
+def mine_block(data, miner, index, prev_hash, difficulty, workers=None):
     start_time = time.time()
 
     print(f"Mining block {index} with difficulty {difficulty}...")
 
-    while True:
-        block = {
-            "index": index,
-            "timestamp": time.time(),
-            "data": data,
-            "prev": prev_hash,
-            "nonce": nonce,
-            "miner": miner,
-            "difficulty": difficulty
-        }
+    block = {
+        "index": index,
+        "timestamp": start_time,
+        "data": data,
+        "merkle_root": merkle_root(data),
+        "prev": prev_hash,
+        "miner": miner,
+        "difficulty": difficulty
+    }
+    prefix, suffix = split_block_encoding(block)
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    if workers > 1 and difficulty >= PARALLEL_MIN_DIFFICULTY:
+        nonce, h = _parallel_search(prefix, suffix, difficulty, workers)
+    else:
+        nonce, h = search_nonce(prefix, suffix, difficulty)
+
+    block["nonce"] = nonce
+    block["hash"] = h
+    block["mining_time"] = time.time() - start_time
+    metrics.pow_seconds.observe(block["mining_time"], difficulty=difficulty)
+    # Parallel workers stride the nonce space, so the winning nonce approximates the total attempts
+    metrics.pow_hash_attempts.inc(nonce + 1, difficulty=difficulty)
+    print(f"Block mined! Nonce: {nonce}, Hash: {h}")
+    return block
+
+
+def _check_block(current):
+    # Checks that only need the block itself; returns an error message or None
+    index = current["index"]
+
+    # Check proof of work
+    # We reconstruct the block without the hash to verify it
+    verification_block = {
+        "index": current["index"],
+        "timestamp": current["timestamp"],
+        "data": current["data"],
+        "prev": current["prev"],
+        "nonce": current["nonce"],
+        "miner": current["miner"],
+        "difficulty": current["difficulty"]
+    }
+    if current.get("merkle_root") is not None:
+        verification_block["merkle_root"] = current["merkle_root"]
+
+    if hash_block(verification_block) != current["hash"]:
+        return f"Block {index} hash corruption or invalid nonce"
 
-        h = hash_block(block)
+    # The header hash only covers the root, so the transactions must still match it
+    if current.get("merkle_root") is not None:
+        try:
+            root = merkle_root(current["data"])
+        except ValueError:
+            return f"Block {index} contains duplicate transactions"
+        if root != current["merkle_root"]:
+            return f"Block {index} transactions do not match merkle root"
 
-        if h.startswith("0" * difficulty):
-            block["hash"] = h
-            block["mining_time"] = time.time() - start_time
-            print(f"Block mined! Nonce: {nonce}, Hash: {h}")
-            return block
+    if not current["hash"].startswith("0" * current.get("difficulty", 2)):
+        return f"Block {index} invalid proof of work"
 
-        nonce += 1
+    return None
 
 
-def validate_chain(blocks):
+def validate_chain(blocks, prev_hash=None):
+    # Without prev_hash, blocks is the whole chain and the genesis block is trusted.
+    # With prev_hash, blocks is the run of blocks above an already verified block
+    # whose hash is prev_hash, and every block in it is checked.
+    if prev_hash is not None:
+        blocks = [{"hash": prev_hash}] + list(blocks)
+
     for i in range(1, len(blocks)):
         current = blocks[i]
         prev = blocks[i - 1]
+        index = current["index"]
 
         # Check hash linkage
         if current["prev"] != prev["hash"]:
-            return False, f"Block {i} prev hash mismatch"
-
-        # Check proof of work
-        # We reconstruct the block without the hash to verify it
-        verification_block = {
-            "index": current["index"],
-            "timestamp": current["timestamp"],
-            "data": current["data"],
-            "prev": current["prev"],
-            "nonce": current["nonce"],
-            "miner": current["miner"],
-            "difficulty": current["difficulty"]
-        }
-
-        if hash_block(verification_block) != current["hash"]:
-            return False, f"Block {i} hash corruption or invalid nonce"
-
-        if not current["hash"].startswith("0" * current.get("difficulty", 2)):
-            return False, f"Block {i} invalid proof of work"
+            return False, f"Block {index} prev hash mismatch"
+
+        message = _check_block(current)
+        if message:
+            return False, message
 
     return True, "Chain valid"
 
+
+# Chains shorter than this are verified in-process; pool start-up would dominate
+PARALLEL_VALIDATION_MIN_BLOCKS = 2000
+
+
+def _first_invalid_block(blocks):
+    for current in blocks:
+        message = _check_block(current)
+        if message:
+            return current["index"], message
+    return None
+
+
+def validate_chain_parallel(blocks, prev_hash=None, workers=None):
+    # Same contract and messages as validate_chain, but block hashes are
+    # recomputed in shards across a process pool. Linkage only compares
+    # neighbouring hashes, so it stays a single cheap pass here.
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers < 2 or len(blocks) < PARALLEL_VALIDATION_MIN_BLOCKS:
+        return validate_chain(blocks, prev_hash)
+
+    if prev_hash is not None:
+        blocks = [{"hash": prev_hash}] + list(blocks)
+
+    failure = next(((cur["index"], f"Block {cur['index']} prev hash mismatch")
+                    for prev, cur in zip(blocks, blocks[1:]) if cur["prev"] != prev["hash"]), None)
+
+    # Several shards per worker so one slow shard doesn't hold up the rest
+    shard_size = -(-(len(blocks) - 1) // (workers * 4))
+    shards = [blocks[i:i + shard_size] for i in range(1, len(blocks), shard_size)]
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=_mp) as pool:
+        futures = [pool.submit(_first_invalid_block, shard) for shard in shards]
+        # Shards are in index order, so the first shard reporting a failure holds the lowest one
+        for shard, future in zip(shards, futures):
+            if failure is not None and shard[0]["index"] > failure[0]:
+                break
+            result = future.result()
+            if result is not None:
+                # On a tie the linkage failure wins, as it is checked first in validate_chain
+                if failure is None or result[0] < failure[0]:
+                    failure = result
+                break
+        for future in futures:
+            future.cancel()
+
+    if failure is not None:
+        return False, failure[1]
+    return True, "Chain valid"
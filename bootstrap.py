@@ -0,0 +1,66 @@
+"""
+One-off startup work: bring the schema up to date and mine any pending
+allocations (e.g. from generate_users) into blocks by "system".
+
+It runs once per deployment rather than in every worker: gunicorn calls it
+from the master before forking (see gunicorn.conf.py), and it can be run on
+its own before starting the server:
+    python bootstrap.py
+
+A lease in the locks table makes sure only one process does the mining even
+if several start at once; the others wait for it to finish. The lease is
+renewed while mining, which can take far longer than SQLite's busy timeout,
+and expires on its own if the holder dies.
+"""
+import time
+
+import database
+from mining_jobs import mine_pending_blocks
+
+LOCK_NAME = "bootstrap"
+# Seconds a lease lasts without renewal
+LOCK_TTL = 30
+# How often a process waiting for the lease retries
+POLL_EVERY = 0.5
+
+
+def process_initial_pending_transactions():
+    """
+    Checks the database for any transactions marked 'pending' (e.g., from initial user generation).
+    If found, it mines them into blocks by the 'system' user to establish initial balances.
+    """
+    db_pending_txs = database.get_pending_transactions()
+
+    if db_pending_txs:
+        print(f"Found {len(db_pending_txs)} initial pending transactions. Mining them into blocks...")
+
+        miner = "system"
+        for block in mine_pending_blocks(miner):
+            print(f"Initial block {block['index']} mined by {miner} containing {len(block['data'])} transactions.")
+    else:
+        print("No initial pending transactions to process.")
+
+
+def bootstrap():
+    """Migrate the schema and mine pending allocations, once across every process starting together"""
+    database.init_db()
+
+    owner = database.new_lock_owner()
+    waited = False
+    while not database.acquire_lock(LOCK_NAME, owner, LOCK_TTL):
+        if not waited:
+            print("Another process is bootstrapping the database, waiting for it to finish...")
+            waited = True
+        time.sleep(POLL_EVERY)
+
+    try:
+        with database.renewing_lock(LOCK_NAME, owner, LOCK_TTL):
+            # A process that waited usually finds nothing left to mine
+            process_initial_pending_transactions()
+    finally:
+        # Forked workers must not inherit this connection
+        database.close_connection()
+
+
+if __name__ == "__main__":
+    bootstrap()
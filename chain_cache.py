@@ -0,0 +1,90 @@
+import threading
+from collections import OrderedDict
+
+import database
+
+# Decoded blocks kept per process, least recently used evicted first
+MAX_CACHED_BLOCKS = 256
+
+
+class ChainCache:
+    """
+    Per-process cache of the chain tip and recently used decoded blocks.
+
+    Blocks committed by this process extend the cache through
+    database.on_block_added. Commits from other connections (other gunicorn
+    workers, or other threads here) are noticed through PRAGMA data_version on
+    the calling thread's connection, which only changes when someone else has
+    written, so checking it costs one tiny query instead of re-reading the chain.
+    Blocks are append-only, so cached blocks stay valid unless the chain shrinks.
+    Returned blocks are shared and must be treated as read-only.
+    """
+
+    def __init__(self, max_blocks=MAX_CACHED_BLOCKS):
+        self.max_blocks = max_blocks
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.db_name = None
+        self.tip = None
+        self.blocks = OrderedDict()
+
+    def _reset_if_db_changed(self):
+        if self.db_name != database.DB_NAME:
+            self.db_name = database.DB_NAME
+            self.tip = None
+            self.blocks.clear()
+
+    def _seen_latest(self):
+        # True if nothing has been committed by another connection since this thread last looked
+        conn = database.get_connection()
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        seen = getattr(self.local, "seen", None)
+        self.local.seen = (conn, version)
+        return seen is not None and seen[0] is conn and seen[1] == version
+
+    def get_tip(self):
+        """{"index", "hash", "difficulty"} of the highest block, or None for an empty chain"""
+        fresh = self._seen_latest()
+        with self.lock:
+            self._reset_if_db_changed()
+            if fresh and self.tip is not None:
+                return dict(self.tip)
+
+        tip = database.get_chain_tip()
+        with self.lock:
+            if tip is None or (self.tip is not None and tip["index"] < self.tip["index"]):
+                self.blocks.clear()
+            self.tip = tip
+        return dict(tip) if tip else None
+
+    def get_block(self, index):
+        with self.lock:
+            self._reset_if_db_changed()
+            block = self.blocks.get(index)
+            if block is not None:
+                self.blocks.move_to_end(index)
+                return block
+
+        block = database.get_block(index)
+        if block is not None:
+            self._remember(block)
+        return block
+
+    def _remember(self, block):
+        with self.lock:
+            self.blocks[block["index"]] = block
+            self.blocks.move_to_end(block["index"])
+            while len(self.blocks) > self.max_blocks:
+                self.blocks.popitem(last=False)
+
+    def block_added(self, block):
+        # Called after add_block commits in this process
+        with self.lock:
+            self._reset_if_db_changed()
+            if self.tip is None or block["index"] > self.tip["index"]:
+                self.tip = {"index": block["index"], "hash": block["hash"], "difficulty": block["difficulty"]}
+        self._remember(block)
+
+
+chain_cache = ChainCache()
+database.on_block_added(chain_cache.block_added)
@@ -1,14 +1,123 @@
 import sqlite3
 import json
 import hashlib
+import inspect
 import time
+import os
+import socket
+import threading
+import uuid
+from contextlib import contextmanager
+
+import metrics
+import segments
 
 DB_NAME = "blockchain.db"
 
-def init_db():
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
+# Applied to every new connection. WAL lets readers run alongside the single
+# writer, and synchronous=NORMAL only fsyncs at checkpoints instead of per commit.
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-20000",      # ~20 MB page cache
+    "PRAGMA mmap_size=268435456",    # 256 MB memory-mapped reads
+    "PRAGMA temp_store=MEMORY",
+)
+
+_local = threading.local()
+
+def get_connection():
+    """
+    Returns this thread's connection to DB_NAME, opening it on first use.
+    Connections are never shared across threads or forked worker processes.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.pid == os.getpid() and _local.db_name == DB_NAME:
+        return conn
+    
+    # isolation_level=None: statements autocommit unless wrapped in transaction().
+    # The per-connection statement cache keeps our fixed queries prepared.
+    conn = sqlite3.connect(DB_NAME, timeout=30, isolation_level=None, cached_statements=256)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    
+    _local.conn = conn
+    _local.pid = os.getpid()
+    _local.db_name = DB_NAME
+    _local.depth = 0
+    return conn
+
+def close_connection():
+    """Close this thread's connection, e.g. before a process forks workers"""
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.pid == os.getpid():
+        conn.close()
+    _local.conn = None
+
+@contextmanager
+def transaction(immediate=True):
+    """
+    Groups every database call made inside the block into one transaction on
+    this thread's connection, committed on exit and rolled back on error.
+    Nested uses join the outermost transaction. Pass immediate=False for a
+    read-only snapshot that doesn't take the write lock.
+    """
+    conn = get_connection()
+    if _local.depth > 0:
+        _local.depth += 1
+        try:
+            yield conn.cursor()
+        finally:
+            _local.depth -= 1
+        return
     
+    conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+    _local.depth = 1
+    _local.callbacks = []
+    try:
+        yield conn.cursor()
+    except BaseException:
+        conn.rollback()
+        raise
+    else:
+        conn.commit()
+        _run_callbacks(_local.callbacks)
+    finally:
+        _local.depth = 0
+        _local.callbacks = []
+
+def _run_callbacks(callbacks):
+    for fn, args in callbacks:
+        try:
+            fn(*args)
+        except Exception as e:
+            # The data is already committed; a failing listener must not undo the caller's work
+            print(f"Post-commit callback {fn.__name__} failed: {e}")
+
+def after_commit(fn, *args):
+    """
+    Runs fn(*args) once the current transaction commits, or straight away
+    outside a transaction. Dropped if the transaction rolls back.
+    """
+    get_connection()
+    if _local.depth > 0:
+        _local.callbacks.append((fn, args))
+    else:
+        _run_callbacks([(fn, args)])
+
+# Callables invoked with each block dict after add_block commits (chain cache, ...)
+_block_listeners = []
+
+def on_block_added(listener):
+    _block_listeners.append(listener)
+    return listener
+
+def init_db():
+    with transaction() as c:
+        migrate(c)
+        _seed(c)
+
+def _migration_base_schema(c):
     c.execute('''CREATE TABLE IF NOT EXISTS blocks
                  (id INTEGER PRIMARY KEY, hash TEXT, miner TEXT, data TEXT, difficulty INTEGER)''')
     
@@ -24,10 +133,188 @@ def init_db():
                  (id INTEGER PRIMARY KEY AUTOINCREMENT,
                   contract_type TEXT, params TEXT, creator TEXT, created_at REAL)''')
     
+    # Materialized per-user balances, kept current by add_block
+    c.execute('''CREATE TABLE IF NOT EXISTS balances
+                 (username TEXT PRIMARY KEY, energy REAL, currency REAL, mining_rewards REAL)''')
+
+def _migration_query_indexes(c):
+    # WHERE status=? [ORDER BY timestamp] -- /pending, pending counts, mining
+    c.execute("CREATE INDEX IF NOT EXISTS idx_transactions_status_timestamp ON transactions (status, timestamp)")
+    # ORDER BY timestamp DESC LIMIT n -- get_all_transactions
+    c.execute("CREATE INDEX IF NOT EXISTS idx_transactions_timestamp ON transactions (timestamp)")
+    # Per-user trade lookups, newest first
+    c.execute("CREATE INDEX IF NOT EXISTS idx_transactions_seller_timestamp ON transactions (seller, timestamp)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_transactions_buyer_timestamp ON transactions (buyer, timestamp)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_blocks_miner ON blocks (miner)")
+
+def _migration_chain_checkpoint(c):
+    # Single row: the chain is known valid up to `height`, whose hash is `tip_hash`
+    c.execute('''CREATE TABLE IF NOT EXISTS chain_checkpoint
+                 (id INTEGER PRIMARY KEY CHECK (id = 0), height INTEGER, tip_hash TEXT, verified_at REAL)''')
+
+def _migration_block_headers(c):
+    # Split blocks into fixed-width headers (everything mine_block hashes except
+    # the transactions) and a body table holding each block's transaction JSON.
+    # Blocks mined before this migration never stored timestamp/nonce, so they
+    # keep NULLs there and prev is filled from the previous row's hash.
+    c.execute('''CREATE TABLE block_bodies
+                 (block_id INTEGER PRIMARY KEY, data TEXT)''')
+    c.execute("INSERT INTO block_bodies (block_id, data) SELECT id, data FROM blocks")
+    
+    c.execute('''CREATE TABLE block_headers
+                 (id INTEGER PRIMARY KEY, hash TEXT, prev TEXT, timestamp REAL, nonce INTEGER,
+                  miner TEXT, difficulty INTEGER, mining_time REAL, tx_count INTEGER)''')
+    c.execute('''INSERT INTO block_headers (id, hash, prev, miner, difficulty, tx_count)
+                 SELECT id, hash, LAG(hash) OVER (ORDER BY id), miner, difficulty, json_array_length(data)
+                 FROM blocks''')
+    c.execute("DROP TABLE blocks")
+    c.execute("ALTER TABLE block_headers RENAME TO blocks")
+    
+    c.execute("CREATE INDEX idx_blocks_miner ON blocks (miner)")
+    # Blocks without a nonce (genesis, pre-migration blocks) can't be re-hashed
+    c.execute("CREATE INDEX idx_blocks_unverifiable ON blocks (id) WHERE nonce IS NULL")
+    _record_trusted_base(c)
+
+def _record_trusted_base(c):
+    # Fix, once, the highest block that can't be re-hashed (the last one mined
+    # before headers were stored, or genesis on a new database). Deriving it
+    # from the nonce column on every audit would let anyone who nulls a
+    # block's nonce move the trust boundary above their edit.
+    c.execute('''CREATE TABLE IF NOT EXISTS trusted_base
+                 (id INTEGER PRIMARY KEY CHECK (id = 0), height INTEGER NOT NULL)''')
+    c.execute("INSERT OR IGNORE INTO trusted_base (id, height) SELECT 0, COALESCE(MAX(id), 0) FROM blocks WHERE nonce IS NULL")
+
+def _migration_merkle_root(c):
+    # NULL for blocks mined before headers committed to their transactions by root
+    c.execute("ALTER TABLE blocks ADD COLUMN merkle_root TEXT")
+
+def _migration_transaction_block(c):
+    # Which block confirmed each transaction, for inclusion proofs
+    c.execute("ALTER TABLE transactions ADD COLUMN block_id INTEGER")
+    # Backfill from blocks whose stored transactions carry their ids
+    c.execute('''UPDATE transactions SET block_id = m.block_id
+                 FROM (SELECT d.block_id, json_extract(j.value, '$.id') AS tx_id
+                       FROM block_bodies d, json_each(d.data) j
+                       WHERE json_extract(j.value, '$.id') IS NOT NULL) AS m
+                 WHERE transactions.id = m.tx_id''')
+
+def _migration_counters(c):
+    # Running totals for /stats, maintained by every write path
+    c.execute('''CREATE TABLE IF NOT EXISTS counters
+                 (name TEXT PRIMARY KEY, value REAL NOT NULL)''')
+    _rebuild_counters(c)
+
+def _migration_events(c):
+    # Append-only log of live-update events, tailed by each process's SSE broker
+    c.execute('''CREATE TABLE IF NOT EXISTS events
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT, type TEXT, data TEXT, created_at REAL)''')
+
+def _migration_mempool(c):
+    # Optional fee a trade offers the miner; the pool is drained highest fee, then highest price, first
+    c.execute("ALTER TABLE transactions ADD COLUMN fee REAL NOT NULL DEFAULT 0")
+    c.execute("CREATE INDEX idx_transactions_pending_priority ON transactions (fee DESC, price DESC, id) WHERE status='pending'")
+    # Energy each seller has committed to pending trades, kept current by every write to the pool
+    c.execute('''CREATE TABLE IF NOT EXISTS reservations
+                 (seller TEXT PRIMARY KEY, energy REAL NOT NULL)''')
+    _rebuild_reservations(c)
+
+def _migration_contract_scope(c):
+    # Which seller and/or buyer a contract binds (NULL: any), so each trade only
+    # evaluates the contracts naming one of its parties plus the global ones
+    c.execute("ALTER TABLE contracts ADD COLUMN seller TEXT")
+    c.execute("ALTER TABLE contracts ADD COLUMN buyer TEXT")
+    c.execute("ALTER TABLE contracts ADD COLUMN status TEXT NOT NULL DEFAULT 'active'")
+    c.execute("CREATE INDEX idx_contracts_seller ON contracts (seller)")
+    c.execute("CREATE INDEX idx_contracts_buyer ON contracts (buyer)")
+
+def _migration_order_book(c):
+    # Limit orders; open ones are the persisted state of the in-memory order book
+    c.execute('''CREATE TABLE IF NOT EXISTS orders
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT, side TEXT, price REAL,
+                  quantity REAL, remaining REAL, status TEXT, created_at REAL)''')
+    c.execute("CREATE INDEX idx_orders_open ON orders (id) WHERE status='open'")
+    c.execute("CREATE INDEX idx_orders_username ON orders (username, id)")
+    # Single row bumped on every change to the book, so each process can tell whether its copy is current
+    c.execute('''CREATE TABLE IF NOT EXISTS order_book_version
+                 (id INTEGER PRIMARY KEY CHECK (id = 0), version INTEGER NOT NULL)''')
+    c.execute("INSERT INTO order_book_version (id, version) VALUES (0, 0)")
+
+def _migration_locks(c):
+    # Named leases for one-off jobs that must run in only one process at a time, across hosts too
+    c.execute('''CREATE TABLE IF NOT EXISTS locks
+                 (name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)''')
+
+def _migration_trade_rollups(c):
+    # Each confirmed trade once per party, keyed for newest-first keyset pagination of a user's history
+    c.execute('''CREATE TABLE IF NOT EXISTS user_trades
+                 (username TEXT, block_id INTEGER, position INTEGER, side TEXT, counterparty TEXT,
+                  energy REAL, price REAL, fee REAL, tx_id INTEGER, timestamp REAL,
+                  PRIMARY KEY (username, block_id, position)) WITHOUT ROWID''')
+    # Confirmed volume per hour and per day; value is the summed trade price, so VWAP is value / energy
+    c.execute('''CREATE TABLE IF NOT EXISTS volume_rollups
+                 (bucket TEXT, start INTEGER, energy REAL NOT NULL, value REAL NOT NULL, trades INTEGER NOT NULL,
+                  PRIMARY KEY (bucket, start)) WITHOUT ROWID''')
+    _rebuild_trade_rollups(c)
+
+def _migration_archive_index(c):
+    # Where archive.py moved each archived block body: its record in a segment
+    # file. The block_bodies row stays, with data NULL.
+    c.execute('''CREATE TABLE IF NOT EXISTS archive_index
+                 (block_id INTEGER PRIMARY KEY, segment INTEGER NOT NULL, offset INTEGER NOT NULL,
+                  length INTEGER NOT NULL)''')
+
+def _migration_mining_jobs(c):
+    # /mine jobs, shared by every worker so any of them can report a job's status
+    c.execute('''CREATE TABLE IF NOT EXISTS mining_jobs
+                 (id TEXT PRIMARY KEY, status TEXT NOT NULL, miner TEXT, created_at REAL, started_at REAL,
+                  finished_at REAL, result TEXT)''')
+    c.execute("CREATE INDEX idx_mining_jobs_status ON mining_jobs (status, created_at)")
+
+def _migration_trusted_base(c):
+    # Databases that took the block_headers migration before it recorded the
+    # boundary get it now, from the state of the chain at this upgrade
+    _record_trusted_base(c)
+
+# Schema changes in order. PRAGMA user_version records how many have been
+# applied, so existing databases are brought forward in place. Only ever
+# append to this list; never edit or reorder an entry that has shipped.
+MIGRATIONS = [
+    _migration_base_schema,
+    _migration_query_indexes,
+    _migration_chain_checkpoint,
+    _migration_block_headers,
+    _migration_merkle_root,
+    _migration_transaction_block,
+    _migration_counters,
+    _migration_events,
+    _migration_mempool,
+    _migration_contract_scope,
+    _migration_order_book,
+    _migration_locks,
+    _migration_trade_rollups,
+    _migration_archive_index,
+    _migration_mining_jobs,
+    _migration_trusted_base,
+]
+
+def get_schema_version():
+    return get_connection().execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(c):
+    """Apply any migrations this database hasn't seen yet; run inside a transaction"""
+    version = c.execute("PRAGMA user_version").fetchone()[0]
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        migration(c)
+        # user_version lives in the database header and is written transactionally
+        c.execute(f"PRAGMA user_version = {number}")
+
+def _seed(c):
     # Genesis block
     c.execute("SELECT COUNT(*) FROM blocks")
     if c.fetchone()[0] == 0:
-        c.execute("INSERT INTO blocks VALUES (0, 'genesis', 'system', '[]', 1)")
+        c.execute("INSERT INTO blocks (id, hash, miner, difficulty, tx_count) VALUES (0, 'genesis', 'system', 1, 0)")
+        c.execute("INSERT INTO block_bodies (block_id, data) VALUES (0, '[]')")
+        increment_counters(c, {"blocks": 1, "difficulty_sum": 1})
     
     # Default admin user (password: admin123)
     c.execute("SELECT COUNT(*) FROM users WHERE username='admin'")
@@ -35,111 +322,687 @@ def init_db():
         pwd_hash = hashlib.sha256("admin123".encode()).hexdigest()
         c.execute("INSERT INTO users (username, password_hash, role, created_at) VALUES (?, ?, ?, ?)",
                   ("admin", pwd_hash, "admin", time.time()))
+        increment_counters(c, {"users:admin": 1})
     
     # Ensure a 'system' user exists for initial allocations (no password needed)
     c.execute("SELECT COUNT(*) FROM users WHERE username='system'")
     if c.fetchone()[0] == 0:
         c.execute("INSERT INTO users (username, password_hash, role, created_at) VALUES (?, ?, ?, ?)",
                   ("system", "", "system", time.time())) # Empty password hash for system
+        increment_counters(c, {"users:system": 1})
     
-    conn.commit()
-    conn.close()
+    # Populate the ledger from the chain for databases created before it existed
+    c.execute("SELECT COUNT(*) FROM balances")
+    if c.fetchone()[0] == 0:
+        _rebuild_balances(c)
 
 def create_user(username, password, role="user"):
     try:
-        conn = sqlite3.connect(DB_NAME)
-        c = conn.cursor()
         pwd_hash = hashlib.sha256(password.encode()).hexdigest()
-        c.execute("INSERT INTO users (username, password_hash, role, created_at) VALUES (?, ?, ?, ?)",
-                  (username, pwd_hash, role, time.time()))
-        conn.commit()
-        conn.close()
+        with transaction() as c:
+            c.execute("INSERT INTO users (username, password_hash, role, created_at) VALUES (?, ?, ?, ?)",
+                      (username, pwd_hash, role, time.time()))
+            increment_counters(c, {f"users:{role}": 1})
         return True
     except sqlite3.IntegrityError:
         return False
     except Exception as e:
         print(f"Error creating user {username}: {e}")
-        conn.close()
         return False
 
 def authenticate_user(username, password):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
+    c = get_connection().cursor()
     pwd_hash = hashlib.sha256(password.encode()).hexdigest()
     c.execute("SELECT * FROM users WHERE username=? AND password_hash=?", (username, pwd_hash))
     user = c.fetchone()
-    conn.close()
     
     if user:
         return {"id": user[0], "username": user[1], "role": user[3]}
     return None
 
 def get_all_users():
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
+    c = get_connection().cursor()
     c.execute("SELECT id, username, role, created_at FROM users")
     rows = c.fetchall()
-    conn.close()
     
     return [{"id": r[0], "username": r[1], "role": r[2], "created_at": r[3]} for r in rows]
 
-def add_block(index, hash_val, miner, data, difficulty):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("INSERT INTO blocks VALUES (?, ?, ?, ?, ?)", (index, hash_val, miner, data, difficulty))
-    conn.commit()
-    conn.close()
+def _apply_block_to_balances(c, miner, txs, difficulty):
+    """Fold one block's mining reward and transactions into the balances table"""
+    deltas = {}
+    
+    def delta(user):
+        if user not in deltas:
+            deltas[user] = [0, 0, 0]
+        return deltas[user]
+    
+    reward = 10 * (difficulty if difficulty is not None else 2)
+    d = delta(miner)
+    d[1] += reward
+    d[2] += reward
+    
+    for tx in txs:
+        fee = tx.get("fee", 0)
+        d = delta(tx["seller"])
+        d[0] -= tx["energy"]
+        d[1] += tx["price"]
+        d = delta(tx["buyer"])
+        d[0] += tx["energy"]
+        d[1] -= tx["price"] + fee
+        delta(miner)[1] += fee
+
+    c.executemany('''INSERT INTO balances (username, energy, currency, mining_rewards) VALUES (?, ?, ?, ?)
+                     ON CONFLICT(username) DO UPDATE SET
+                         energy = energy + excluded.energy,
+                         currency = currency + excluded.currency,
+                         mining_rewards = mining_rewards + excluded.mining_rewards''',
+                  [(user, d[0], d[1], d[2]) for user, d in deltas.items()])
+
+def _rebuild_balances(c):
+    c.execute("DELETE FROM balances")
+    c.execute("SELECT b.id, b.miner, d.data, b.difficulty FROM blocks b JOIN block_bodies d ON d.block_id = b.id ORDER BY b.id")
+    for block_id, miner, data, difficulty in c.fetchall():
+        _apply_block_to_balances(c, miner, json.loads(_body(block_id, data)), difficulty)
+
+def rebuild_balances():
+    """Recompute the balances table from scratch by replaying the whole chain"""
+    with transaction() as c:
+        _rebuild_balances(c)
+
+def add_block(block):
+    """Store a block as returned by mine_block: header row, body row and ledger update in one transaction"""
+    with transaction() as c:
+        c.execute('''INSERT INTO blocks (id, hash, prev, timestamp, nonce, miner, difficulty, mining_time, tx_count, merkle_root)
+                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                  (block["index"], block["hash"], block["prev"], block["timestamp"], block["nonce"],
+                   block["miner"], block["difficulty"], block.get("mining_time"), len(block["data"]),
+                   block.get("merkle_root")))
+        c.execute("INSERT INTO block_bodies (block_id, data) VALUES (?, ?)", (block["index"], json.dumps(block["data"])))
+        # Same transaction as the block insert, so the ledger never diverges from the chain
+        _apply_block_to_balances(c, block["miner"], block["data"], block["difficulty"])
+        _apply_block_to_rollups(c, block["index"], block["timestamp"], block["data"])
+        increment_counters(c, {"blocks": 1, "difficulty_sum": block["difficulty"]})
+        
+        publish_event(c, "block", {"index": block["index"], "hash": block["hash"], "miner": block["miner"],
+                                   "difficulty": block["difficulty"], "tx_count": len(block["data"])})
+        affected = {block["miner"]}
+        for tx in block["data"]:
+            affected.update((tx["seller"], tx["buyer"]))
+        publish_event(c, "balances", {"users": sorted(affected)})
+        for listener in _block_listeners:
+            after_commit(listener, block)
+
+BLOCK_COLUMNS = "b.id, b.hash, b.prev, b.timestamp, b.nonce, b.miner, b.difficulty, b.mining_time, b.merkle_root"
+BLOCK_KEYS = ("index", "hash", "prev", "timestamp", "nonce", "miner", "difficulty", "mining_time", "merkle_root")
+
+# Segment files live beside the database unless ARCHIVE_DIR says otherwise
+ARCHIVE_DIR = os.environ.get("ARCHIVE_DIR")
+
+def get_archive_dir():
+    return ARCHIVE_DIR or os.path.splitext(DB_NAME)[0] + "-archive"
+
+def _body(block_id, data):
+    """A block's transaction JSON: data from block_bodies, or its archived record once that is NULL"""
+    if data is not None:
+        return data
+    c = get_connection().cursor()
+    c.execute("SELECT segment, offset, length FROM archive_index WHERE block_id=?", (block_id,))
+    return segments.reader.read(get_archive_dir(), *c.fetchone()).decode()
+
+def _block_from_row(row):
+    block = dict(zip(BLOCK_KEYS, row))
+    block["data"] = json.loads(_body(row[0], row[len(BLOCK_KEYS)]))
+    return block
 
 def get_all_blocks():
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("SELECT * FROM blocks")
+    c = get_connection().cursor()
+    c.execute(f"SELECT {BLOCK_COLUMNS}, d.data FROM blocks b JOIN block_bodies d ON d.block_id = b.id ORDER BY b.id")
+    rows = c.fetchall()
+    
+    return [_block_from_row(row) for row in rows]
+
+def get_blocks_after(height):
+    c = get_connection().cursor()
+    c.execute(f"SELECT {BLOCK_COLUMNS}, d.data FROM blocks b JOIN block_bodies d ON d.block_id = b.id WHERE b.id > ? ORDER BY b.id",
+              (height,))
     rows = c.fetchall()
-    conn.close()
-    
-    blocks = []
-    for row in rows:
-        blocks.append({
-            "index": row[0],
-            "hash": row[1],
-            "miner": row[2],
-            "data": json.loads(row[3]),
-            "difficulty": row[4]
-        })
-    return blocks
-
-def add_transaction(seller, buyer, energy, price, status):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("INSERT INTO transactions (seller, buyer, energy, price, status, timestamp) VALUES (?, ?, ?, ?, ?, ?)",
-              (seller, buyer, energy, price, status, time.time()))
-    conn.commit()
-    conn.close()
+    
+    return [_block_from_row(row) for row in rows]
+
+def get_chain_tip():
+    """Header of the highest block as {"index", "hash", "difficulty"}, without touching block bodies"""
+    c = get_connection().cursor()
+    c.execute("SELECT id, hash, difficulty FROM blocks ORDER BY id DESC LIMIT 1")
+    row = c.fetchone()
+    return {"index": row[0], "hash": row[1], "difficulty": row[2]} if row else None
+
+def get_trusted_base():
+    """
+    (height, hash) of the highest block that has no stored nonce: genesis, or the
+    last block mined before headers were persisted. It is recorded once by the
+    migrations rather than read off the nonce column. Full verification starts above it.
+    """
+    c = get_connection().cursor()
+    c.execute("SELECT b.id, b.hash FROM trusted_base t JOIN blocks b ON b.id = t.height WHERE t.id = 0")
+    return c.fetchone()
+
+def get_unverifiable_block_above(height):
+    """Index of the lowest block above height with no stored nonce, or None. There should never be one."""
+    c = get_connection().cursor()
+    c.execute("SELECT id FROM blocks WHERE nonce IS NULL AND id > ? ORDER BY id LIMIT 1", (height,))
+    row = c.fetchone()
+    return row[0] if row else None
+
+def get_block(index):
+    c = get_connection().cursor()
+    c.execute(f"SELECT {BLOCK_COLUMNS}, d.data FROM blocks b JOIN block_bodies d ON d.block_id = b.id WHERE b.id=?",
+              (index,))
+    row = c.fetchone()
+    return _block_from_row(row) if row else None
+
+def get_transaction_block_id(tx_id):
+    """Index of the block that confirmed transaction tx_id, or None if it isn't confirmed"""
+    c = get_connection().cursor()
+    c.execute("SELECT block_id FROM transactions WHERE id=?", (tx_id,))
+    row = c.fetchone()
+    return row[0] if row else None
+
+def get_block_hash(index):
+    c = get_connection().cursor()
+    c.execute("SELECT hash FROM blocks WHERE id=?", (index,))
+    row = c.fetchone()
+    return row[0] if row else None
+
+def new_lock_owner():
+    """A lock owner id unique to this process and call, naming the host and pid for debugging"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+def acquire_lock(name, owner, ttl):
+    """Take the named lease for ttl seconds if it is free or expired. Returns True if owner holds it."""
+    now = time.time()
+    with transaction() as c:
+        c.execute("DELETE FROM locks WHERE name=? AND expires_at < ?", (name, now))
+        c.execute("INSERT OR IGNORE INTO locks (name, owner, expires_at) VALUES (?, ?, ?)", (name, owner, now + ttl))
+        c.execute("SELECT owner FROM locks WHERE name=?", (name,))
+        return c.fetchone()[0] == owner
+
+def renew_lock(name, owner, ttl):
+    """Extend a lease owner still holds; returns False if it has lapsed to someone else"""
+    with transaction() as c:
+        c.execute("UPDATE locks SET expires_at=? WHERE name=? AND owner=?", (time.time() + ttl, name, owner))
+        return c.rowcount == 1
+
+def release_lock(name, owner):
+    with transaction() as c:
+        c.execute("DELETE FROM locks WHERE name=? AND owner=?", (name, owner))
+
+@contextmanager
+def renewing_lock(name, owner, ttl):
+    """
+    Keep a lease owner already holds from expiring while the block runs, renewing
+    it from a background thread every ttl / 3 seconds, and release it afterwards.
+    For jobs that may outlast the lease, such as mining.
+    """
+    stop = threading.Event()
+    
+    def renew():
+        while not stop.wait(ttl / 3):
+            if not renew_lock(name, owner, ttl):
+                print(f"Lost the {name} lock; another process may take over its work.")
+                break
+        close_connection()
+    
+    renewer = threading.Thread(target=renew, name=f"{name}-lease", daemon=True)
+    renewer.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        renewer.join()
+        release_lock(name, owner)
+
+MINING_JOB_KEYS = ("id", "status", "miner", "created_at", "started_at", "finished_at", "result")
+# Finished jobs are forgotten oldest-first beyond this many
+MAX_MINING_JOBS = 1000
+
+def _mining_job_from_row(row):
+    job = dict(zip(MINING_JOB_KEYS, row))
+    job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+    return job
+
+def submit_mining_job(job_id, miner):
+    """Queue a job for miner, or join the one already waiting to start. Returns (job, coalesced)."""
+    with transaction() as c:
+        c.execute(f"SELECT {', '.join(MINING_JOB_KEYS)} FROM mining_jobs WHERE status='queued' ORDER BY created_at LIMIT 1")
+        row = c.fetchone()
+        if row is not None:
+            return _mining_job_from_row(row), True
+        c.execute("INSERT INTO mining_jobs (id, status, miner, created_at) VALUES (?, 'queued', ?, ?)",
+                  (job_id, miner, time.time()))
+        c.execute(f"SELECT {', '.join(MINING_JOB_KEYS)} FROM mining_jobs WHERE id=?", (job_id,))
+        return _mining_job_from_row(c.fetchone()), False
+
+def get_mining_job(job_id):
+    c = get_connection().cursor()
+    c.execute(f"SELECT {', '.join(MINING_JOB_KEYS)} FROM mining_jobs WHERE id=?", (job_id,))
+    row = c.fetchone()
+    return _mining_job_from_row(row) if row else None
+
+def has_queued_mining_job():
+    c = get_connection().cursor()
+    c.execute("SELECT 1 FROM mining_jobs WHERE status='queued' LIMIT 1")
+    return c.fetchone() is not None
+
+def claim_mining_job():
+    """Move the oldest queued job to mining and return it, or None if none is queued"""
+    with transaction() as c:
+        c.execute(f"SELECT {', '.join(MINING_JOB_KEYS)} FROM mining_jobs WHERE status='queued' ORDER BY created_at LIMIT 1")
+        row = c.fetchone()
+        if row is None:
+            return None
+        job = _mining_job_from_row(row)
+        job["status"], job["started_at"] = "mining", time.time()
+        c.execute("UPDATE mining_jobs SET status=?, started_at=? WHERE id=?", (job["status"], job["started_at"], job["id"]))
+        return job
+
+def finish_mining_job(job_id, status, result):
+    with transaction() as c:
+        c.execute("UPDATE mining_jobs SET status=?, result=?, finished_at=? WHERE id=?",
+                  (status, json.dumps(result), time.time(), job_id))
+        c.execute('''DELETE FROM mining_jobs WHERE id IN
+                     (SELECT id FROM mining_jobs WHERE status IN ('done', 'failed') ORDER BY finished_at DESC LIMIT -1 OFFSET ?)''',
+                  (MAX_MINING_JOBS,))
+
+def fail_abandoned_mining_jobs():
+    """Fail jobs left mining by a process that died; only call while holding the mining lock"""
+    with transaction() as c:
+        c.execute("UPDATE mining_jobs SET status='failed', result=?, finished_at=? WHERE status='mining'",
+                  (json.dumps({"error": "The process mining this job exited before finishing it"}), time.time()))
+        return c.rowcount
+
+def get_hot_bodies(max_height, after=-1, limit=1000):
+    """[(block_id, data)] for bodies still in block_bodies with after < block_id <= max_height, in order"""
+    c = get_connection().cursor()
+    c.execute('''SELECT block_id, data FROM block_bodies
+                 WHERE block_id > ? AND block_id <= ? AND data IS NOT NULL ORDER BY block_id LIMIT ?''',
+              (after, max_height, limit))
+    return c.fetchall()
+
+def archive_bodies(entries):
+    """Record (block_id, segment, offset, length) for bodies now stored in segments and drop them from block_bodies"""
+    with transaction() as c:
+        c.executemany("INSERT OR REPLACE INTO archive_index (block_id, segment, offset, length) VALUES (?, ?, ?, ?)",
+                      entries)
+        c.executemany("UPDATE block_bodies SET data=NULL WHERE block_id=?", [(entry[0],) for entry in entries])
+
+def get_chain_checkpoint():
+    """Returns (height, tip_hash) of the last verified block, or None if nothing is verified yet"""
+    c = get_connection().cursor()
+    c.execute("SELECT height, tip_hash FROM chain_checkpoint WHERE id=0")
+    return c.fetchone()
+
+def set_chain_checkpoint(height, tip_hash):
+    with transaction() as c:
+        c.execute("INSERT OR REPLACE INTO chain_checkpoint (id, height, tip_hash, verified_at) VALUES (0, ?, ?, ?)",
+                  (height, tip_hash, time.time()))
+
+def clear_chain_checkpoint():
+    with transaction() as c:
+        c.execute("DELETE FROM chain_checkpoint")
+
+def iter_blocks_json(after=None, limit=None):
+    """
+    Yields (index, block JSON object string) in index order, starting after
+    block index `after`. Rows are stepped from the cursor one at a time and the
+    stored `data` JSON is spliced in verbatim instead of being decoded and
+    re-encoded.
+    """
+    sql = f"SELECT {BLOCK_COLUMNS}, d.data FROM blocks b JOIN block_bodies d ON d.block_id = b.id"
+    params = []
+    if after is not None:
+        sql += " WHERE b.id > ?"
+        params.append(after)
+    sql += " ORDER BY b.id"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    
+    c = get_connection().cursor()
+    c.execute(sql, params)
+    for row in c:
+        header = ", ".join(f'"{key}": {json.dumps(value)}' for key, value in zip(BLOCK_KEYS, row))
+        yield row[0], '{%s, "data": %s}' % (header, _body(row[0], row[len(BLOCK_KEYS)]))
+
+def add_transaction(seller, buyer, energy, price, status, fee=0):
+    return add_transactions([{"seller": seller, "buyer": buyer, "energy": energy, "price": price, "fee": fee}], status)[0]
+
+def add_transactions(txs, status):
+    """
+    Insert a batch of transactions ({seller, buyer, energy, price[, fee]}) in one
+    transaction and return their ids in the same order. Pending ones reserve
+    their energy against the seller. No contract checks happen here; trades
+    from users go through mempool.admit.
+    """
+    now = time.time()
+    tx_ids = []
+    reserved = {}
+    with transaction() as c:
+        for tx in txs:
+            fee = tx.get("fee", 0)
+            c.execute("INSERT INTO transactions (seller, buyer, energy, price, fee, status, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                      (tx["seller"], tx["buyer"], tx["energy"], tx["price"], fee, status, now))
+            tx_ids.append(c.lastrowid)
+            if status == "pending":
+                reserved[tx["seller"]] = reserved.get(tx["seller"], 0) + tx["energy"]
+                publish_event(c, "pending_tx", {"id": c.lastrowid, "seller": tx["seller"], "buyer": tx["buyer"],
+                                                "energy": tx["energy"], "price": tx["price"], "fee": fee})
+        increment_counters(c, {f"tx:{status}": len(tx_ids)})
+        adjust_reservations(c, reserved)
+    return tx_ids
+
+def get_pending_transactions():
+    """The whole pending pool in block-building order: highest fee, then highest price, then oldest"""
+    c = get_connection().cursor()
+    # Without ANALYZE statistics the planner prefers idx_transactions_status_timestamp
+    # plus a sort of the whole pool; the priority index already holds this order
+    c.execute('''SELECT id, seller, buyer, energy, price, fee FROM transactions INDEXED BY idx_transactions_pending_priority
+                 WHERE status='pending' ORDER BY fee DESC, price DESC, id''')
+    rows = c.fetchall()
+    
+    return [{"id": r[0], "seller": r[1], "buyer": r[2], "energy": r[3], "price": r[4], "fee": r[5]} for r in rows]
+
+def confirm_transactions(tx_ids, block_id):
+    """
+    Mark the given pending transactions confirmed in block_id by primary key; call
+    inside the same transaction as add_block. Returns how many rows were confirmed.
+    """
+    with transaction() as c:
+        # The energy leaves the seller's balance in add_block, so release its reservation
+        c.execute('''SELECT seller, SUM(energy) FROM transactions
+                     WHERE id IN (SELECT value FROM json_each(?)) AND status='pending' GROUP BY seller''',
+                  (json.dumps(list(tx_ids)),))
+        released = {seller: -energy for seller, energy in c.fetchall()}
+        
+        c.executemany("UPDATE transactions SET status='confirmed', block_id=? WHERE id=? AND status='pending'",
+                      [(block_id, tx_id) for tx_id in tx_ids])
+        confirmed = c.rowcount
+        increment_counters(c, {"tx:pending": -confirmed, "tx:confirmed": confirmed})
+        adjust_reservations(c, released)
+        return confirmed
+
+def adjust_reservations(c, deltas):
+    """Add deltas ({seller: energy}) to sellers' reserved pending energy, inside the caller's transaction"""
+    c.executemany('''INSERT INTO reservations (seller, energy) VALUES (?, ?)
+                     ON CONFLICT(seller) DO UPDATE SET energy = energy + excluded.energy''',
+                  list(deltas.items()))
+    # Drop sellers with nothing left pending (allowing for float round-off)
+    c.executemany("DELETE FROM reservations WHERE seller=? AND energy < 1e-9", [(seller,) for seller in deltas])
+
+def _rebuild_reservations(c):
+    c.execute("DELETE FROM reservations")
+    c.execute('''INSERT INTO reservations (seller, energy)
+                 SELECT seller, SUM(energy) FROM transactions WHERE status='pending'
+                 GROUP BY seller HAVING SUM(energy) > 0''')
+
+def rebuild_reservations():
+    """Recompute every seller's reservation from the pending pool"""
+    with transaction() as c:
+        _rebuild_reservations(c)
+
+def get_reservations(sellers):
+    """Reserved pending energy for many sellers at once, as {seller: energy}; sellers with none are omitted"""
+    sellers = list(set(sellers))
+    reserved = {}
+    c = get_connection().cursor()
+    for i in range(0, len(sellers), 500):
+        chunk = sellers[i:i + 500]
+        c.execute(f"SELECT seller, energy FROM reservations WHERE seller IN ({','.join('?' * len(chunk))})", chunk)
+        reserved.update(c.fetchall())
+    return reserved
+
+def increment_counters(c, deltas):
+    """Add deltas ({counter name: amount}) to the counters table, inside the caller's transaction"""
+    c.executemany('''INSERT INTO counters (name, value) VALUES (?, ?)
+                     ON CONFLICT(name) DO UPDATE SET value = value + excluded.value''',
+                  list(deltas.items()))
+
+def _rebuild_counters(c):
+    c.execute("DELETE FROM counters")
+    c.execute("SELECT COUNT(*), COALESCE(SUM(difficulty), 0) FROM blocks")
+    blocks, difficulty_sum = c.fetchone()
+    deltas = {"blocks": blocks, "difficulty_sum": difficulty_sum}
+    c.execute("SELECT status, COUNT(*) FROM transactions GROUP BY status")
+    deltas.update({f"tx:{status}": count for status, count in c.fetchall()})
+    c.execute("SELECT role, COUNT(*) FROM users GROUP BY role")
+    deltas.update({f"users:{role}": count for role, count in c.fetchall()})
+    c.execute("SELECT COUNT(*) FROM contracts")
+    deltas["contracts"] = c.fetchone()[0]
+    increment_counters(c, deltas)
+
+def rebuild_counters():
+    """Recompute every counter from the underlying tables"""
+    with transaction() as c:
+        _rebuild_counters(c)
+
+def get_counters():
+    c = get_connection().cursor()
+    c.execute("SELECT name, value FROM counters")
+    return dict(c.fetchall())
+
+# Events older than the newest this many are pruned as new ones are written
+EVENT_RETENTION = 10000
+
+def publish_event(c, event_type, data):
+    """Append a live-update event inside the caller's transaction, so it only appears if the write commits"""
+    c.execute("INSERT INTO events (type, data, created_at) VALUES (?, ?, ?)", (event_type, json.dumps(data), time.time()))
+    if c.lastrowid % 1000 == 0:
+        c.execute("DELETE FROM events WHERE id <= ?", (c.lastrowid - EVENT_RETENTION,))
+
+def get_last_event_id():
+    c = get_connection().cursor()
+    c.execute("SELECT MAX(id) FROM events")
+    return c.fetchone()[0] or 0
+
+def get_events_after(event_id, limit=1000):
+    c = get_connection().cursor()
+    c.execute("SELECT id, type, data FROM events WHERE id > ? ORDER BY id LIMIT ?", (event_id, limit))
+    return [{"id": r[0], "type": r[1], "data": json.loads(r[2])} for r in c.fetchall()]
+
+CONTRACT_KEYS = ("id", "contract_type", "params", "creator", "created_at", "seller", "buyer", "status")
+
+def _contract_from_row(row):
+    contract = dict(zip(CONTRACT_KEYS, row))
+    contract["params"] = json.loads(contract["params"])
+    return contract
+
+def add_contract(contract_type, params, creator, seller=None, buyer=None):
+    with transaction() as c:
+        c.execute("INSERT INTO contracts (contract_type, params, creator, created_at, seller, buyer) VALUES (?, ?, ?, ?, ?, ?)",
+                  (contract_type, json.dumps(params), creator, time.time(), seller, buyer))
+        increment_counters(c, {"contracts": 1})
+        return c.lastrowid
+
+def get_contracts(seller=None, buyer=None, status=None):
+    """Stored contracts in creation order, optionally only those binding seller/buyer or with a given status"""
+    sql = f"SELECT {', '.join(CONTRACT_KEYS)} FROM contracts"
+    conditions, params = [], []
+    for column, value in (("seller", seller), ("buyer", buyer), ("status", status)):
+        if value is not None:
+            conditions.append(f"{column}=?")
+            params.append(value)
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    
+    c = get_connection().cursor()
+    c.execute(sql + " ORDER BY id", params)
+    return [_contract_from_row(row) for row in c.fetchall()]
+
+def get_last_contract_id():
+    c = get_connection().cursor()
+    c.execute("SELECT MAX(id) FROM contracts")
+    return c.fetchone()[0] or 0
+
+ORDER_KEYS = ("id", "username", "side", "price", "quantity", "remaining", "status", "created_at")
+
+def add_order(username, side, price, quantity):
+    with transaction() as c:
+        c.execute("INSERT INTO orders (username, side, price, quantity, remaining, status, created_at) VALUES (?, ?, ?, ?, ?, 'open', ?)",
+                  (username, side, price, quantity, quantity, time.time()))
+        return c.lastrowid
+
+def update_orders(updates):
+    """Apply (remaining, status, order id) updates"""
+    with transaction() as c:
+        c.executemany("UPDATE orders SET remaining=?, status=? WHERE id=?", updates)
+
+def get_order(order_id):
+    c = get_connection().cursor()
+    c.execute(f"SELECT {', '.join(ORDER_KEYS)} FROM orders WHERE id=?", (order_id,))
+    row = c.fetchone()
+    return dict(zip(ORDER_KEYS, row)) if row else None
+
+def get_open_orders():
+    """Every open order, oldest first"""
+    c = get_connection().cursor()
+    c.execute(f"SELECT {', '.join(ORDER_KEYS)} FROM orders WHERE status='open' ORDER BY id")
+    return [dict(zip(ORDER_KEYS, row)) for row in c.fetchall()]
+
+def get_user_orders(username, limit=100):
+    """A user's orders, newest first"""
+    c = get_connection().cursor()
+    c.execute(f"SELECT {', '.join(ORDER_KEYS)} FROM orders WHERE username=? ORDER BY id DESC LIMIT ?", (username, limit))
+    return [dict(zip(ORDER_KEYS, row)) for row in c.fetchall()]
+
+def get_order_book_version():
+    c = get_connection().cursor()
+    c.execute("SELECT version FROM order_book_version WHERE id=0")
+    return c.fetchone()[0]
+
+def bump_order_book_version():
+    """Record a change to the order book and return the new version; call inside the transaction making it"""
+    with transaction() as c:
+        c.execute("UPDATE order_book_version SET version = version + 1 WHERE id=0")
+        c.execute("SELECT version FROM order_book_version WHERE id=0")
+        return c.fetchone()[0]
+
+# Bucket widths for volume_rollups, in seconds (UTC)
+VOLUME_BUCKETS = {"hour": 3600, "day": 86400}
+
+def _apply_block_to_rollups(c, block_id, timestamp, txs):
+    """Fold one block's trades into user_trades and volume_rollups, inside the caller's transaction"""
+    rows = []
+    volume = {}
+    for position, tx in enumerate(txs):
+        # Allocations from 'system' are grants rather than trades
+        if tx["seller"] == "system":
+            continue
+        fee = tx.get("fee", 0)
+        rows.append((tx["seller"], block_id, position, "sell", tx["buyer"], tx["energy"], tx["price"], fee,
+                     tx.get("id"), timestamp))
+        rows.append((tx["buyer"], block_id, position, "buy", tx["seller"], tx["energy"], tx["price"], fee,
+                     tx.get("id"), timestamp))
+        # Blocks mined before headers were stored have no time to bucket by
+        if timestamp is not None:
+            for bucket, width in VOLUME_BUCKETS.items():
+                totals = volume.setdefault((bucket, int(timestamp // width * width)), [0, 0, 0])
+                totals[0] += tx["energy"]
+                totals[1] += tx["price"]
+                totals[2] += 1
+    
+    c.executemany('''INSERT INTO user_trades (username, block_id, position, side, counterparty, energy, price, fee, tx_id, timestamp)
+                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', rows)
+    c.executemany('''INSERT INTO volume_rollups (bucket, start, energy, value, trades) VALUES (?, ?, ?, ?, ?)
+                     ON CONFLICT(bucket, start) DO UPDATE SET
+                         energy = energy + excluded.energy,
+                         value = value + excluded.value,
+                         trades = trades + excluded.trades''',
+                  [(bucket, start, *totals) for (bucket, start), totals in volume.items()])
+
+def _rebuild_trade_rollups(c):
+    c.execute("DELETE FROM user_trades")
+    c.execute("DELETE FROM volume_rollups")
+    # Pre-header blocks have no timestamp; fall back to when their transactions were submitted
+    c.execute('''SELECT b.id, COALESCE(b.timestamp, (SELECT MAX(t.timestamp) FROM transactions t WHERE t.block_id = b.id)), d.data
+                 FROM blocks b JOIN block_bodies d ON d.block_id = b.id ORDER BY b.id''')
+    for block_id, timestamp, data in c.fetchall():
+        _apply_block_to_rollups(c, block_id, timestamp, json.loads(_body(block_id, data)))
+
+def rebuild_trade_rollups():
+    """Recompute user_trades and volume_rollups by replaying the whole chain"""
+    with transaction() as c:
+        _rebuild_trade_rollups(c)
+
+TRADE_KEYS = ("block_id", "position", "side", "counterparty", "energy", "price", "fee", "tx_id", "timestamp")
+
+def get_user_trades(username, before=None, limit=50):
+    """
+    A user's confirmed trades, newest first. before, a (block_id, position) pair
+    from the last trade of the previous page, continues from there.
+    """
+    sql = f"SELECT {', '.join(TRADE_KEYS)} FROM user_trades WHERE username=?"
+    params = [username]
+    if before is not None:
+        sql += " AND (block_id, position) < (?, ?)"
+        params.extend(before)
+    
+    c = get_connection().cursor()
+    c.execute(sql + " ORDER BY block_id DESC, position DESC LIMIT ?", params + [limit])
+    return [dict(zip(TRADE_KEYS, row)) for row in c.fetchall()]
+
+def get_volume(bucket, since=None, until=None, limit=100):
+    """
+    The newest `limit` buckets of confirmed volume starting in [since, until),
+    oldest first, as {"start", "energy", "value", "trades"}.
+    """
+    sql = "SELECT start, energy, value, trades FROM volume_rollups WHERE bucket=?"
+    params = [bucket]
+    if since is not None:
+        sql += " AND start >= ?"
+        params.append(since)
+    if until is not None:
+        sql += " AND start < ?"
+        params.append(until)
+    
+    c = get_connection().cursor()
+    c.execute(sql + " ORDER BY start DESC LIMIT ?", params + [limit])
+    return [{"start": r[0], "energy": r[1], "value": r[2], "trades": r[3]} for r in reversed(c.fetchall())]
 
 def get_all_transactions():
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("SELECT * FROM transactions ORDER BY timestamp DESC LIMIT 100")
+    c = get_connection().cursor()
+    c.execute("SELECT id, seller, buyer, energy, price, status, timestamp FROM transactions ORDER BY timestamp DESC LIMIT 100")
     rows = c.fetchall()
-    conn.close()
     
     return [{"id": r[0], "seller": r[1], "buyer": r[2], "energy": r[3], 
              "price": r[4], "status": r[5], "timestamp": r[6]} for r in rows]
 
+def get_user_balances(users):
+    """Balances for many users at once, as {username: balance}; users without a row get zeros"""
+    users = list(set(users))
+    balances = {user: {"energy": 0, "currency": 0, "mining_rewards": 0} for user in users}
+    c = get_connection().cursor()
+    for i in range(0, len(users), 500):
+        chunk = users[i:i + 500]
+        c.execute(f"SELECT username, energy, currency, mining_rewards FROM balances WHERE username IN ({','.join('?' * len(chunk))})",
+                  chunk)
+        for row in c.fetchall():
+            balances[row[0]] = {"energy": row[1], "currency": row[2], "mining_rewards": row[3]}
+    return balances
+
 def get_user_balance(user):
-    blocks = get_all_blocks()
-    energy = currency = 0
+    c = get_connection().cursor()
+    c.execute("SELECT energy, currency, mining_rewards FROM balances WHERE username=?", (user,))
+    row = c.fetchone()
     
-    for block in blocks:
-        if block["miner"] == user:
-            currency += 10 * block.get("difficulty", 2)
-        
-        for tx in block["data"]:
-            if tx["seller"] == user:
-                energy -= tx["energy"]
-                currency += tx["price"]
-            if tx["buyer"] == user:
-                energy += tx["energy"]
-                currency -= tx["price"]
-    
-    return {"energy": energy, "currency": currency}
+    if row is None:
+        return {"energy": 0, "currency": 0, "mining_rewards": 0}
+    return {"energy": row[0], "currency": row[1], "mining_rewards": row[2]}
+
+# Time every public function above into metrics.db_call_seconds. Connection and
+# transaction plumbing is too fine-grained to be worth it, and generators would
+# only be timed up to their first yield.
+_UNTIMED = {"get_connection", "transaction", "after_commit", "on_block_added", "contextmanager", "get_archive_dir",
+            "new_lock_owner", "renewing_lock"}
+for _name, _fn in list(globals().items()):
+    if (callable(_fn) and getattr(_fn, "__module__", None) == __name__ and not _name.startswith("_")
+            and _name not in _UNTIMED and not inspect.isgeneratorfunction(_fn) and not isinstance(_fn, type)):
+        globals()[_name] = metrics.timed_db_call(_fn)
@@ -0,0 +1,130 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+import database
+
+# How often the broker looks for new events while anyone is subscribed
+POLL_INTERVAL = 0.5
+# Comment line sent to idle streams so dead connections get noticed
+HEARTBEAT_INTERVAL = 15
+# Recent events kept in memory for subscribers that fall slightly behind
+BUFFER_SIZE = 1000
+# Open streams allowed per worker process. Each one holds a request thread for
+# as long as the browser stays connected, so this must stay well below the
+# worker's thread count (see gunicorn.conf.py); clients turned away poll
+# /events/poll instead.
+MAX_SUBSCRIBERS = int(os.environ.get("SSE_MAX_SUBSCRIBERS", 16))
+
+
+class EventBroker:
+    """
+    Fans events out to this process's Server-Sent Events subscribers.
+
+    Write paths append rows to the events table inside their own transactions
+    (database.publish_event), so events from every gunicorn worker land in one
+    ordered log. A single thread per process tails that log, and only while
+    someone is subscribed; each subscriber just sleeps on a condition until a
+    newer event arrives, so idle clients cost no queries. Subscribers do each
+    hold a server thread, though, so at most max_subscribers streams are open
+    at once.
+    """
+
+    def __init__(self, max_subscribers=MAX_SUBSCRIBERS):
+        self.max_subscribers = max_subscribers
+        self.condition = threading.Condition()
+        self.buffer = deque(maxlen=BUFFER_SIZE)
+        self.last_id = None
+        self.subscribers = 0
+        self.thread = None
+
+    def _start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.last_id = database.get_last_event_id()
+            self.thread = threading.Thread(target=self._run, name="event-broker", daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        version = None
+        while True:
+            time.sleep(POLL_INTERVAL)
+            with self.condition:
+                if not self.subscribers:
+                    continue
+
+            # data_version only moves when another connection commits
+            current = database.get_connection().execute("PRAGMA data_version").fetchone()[0]
+            if current == version:
+                continue
+            version = current
+
+            while True:
+                events = database.get_events_after(self.last_id)
+                if not events:
+                    break
+                with self.condition:
+                    self.buffer.extend(events)
+                    self.last_id = events[-1]["id"]
+                    self.condition.notify_all()
+
+    def subscribe(self, last_event_id=None):
+        """
+        A Subscription streaming SSE-formatted chunks, starting after
+        last_event_id if the client is resuming, or None if this process
+        already has max_subscribers open streams.
+        """
+        with self.condition:
+            if self.subscribers >= self.max_subscribers:
+                return None
+            self._start()
+            self.subscribers += 1
+            cursor = last_event_id if last_event_id is not None else self.last_id
+        return Subscription(self, self._stream(cursor))
+
+    def _release(self):
+        with self.condition:
+            self.subscribers -= 1
+
+    def _stream(self, cursor):
+        yield "retry: 3000\n\n"
+        while True:
+            with self.condition:
+                pending = [e for e in self.buffer if e["id"] > cursor]
+                if not pending:
+                    self.condition.wait(HEARTBEAT_INTERVAL)
+                    pending = [e for e in self.buffer if e["id"] > cursor]
+
+            if not pending:
+                yield ": keep-alive\n\n"
+                continue
+
+            for event in pending:
+                cursor = event["id"]
+                yield f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+
+
+class Subscription:
+    """
+    Iterable response body holding one of the broker's slots until the server
+    closes it, which it does even if the client left before the first chunk
+    (when a bare generator's cleanup would never run).
+    """
+
+    def __init__(self, broker, stream):
+        self.broker = broker
+        self.stream = stream
+        self.released = False
+
+    def __iter__(self):
+        return self.stream
+
+    def close(self):
+        self.stream.close()
+        if not self.released:
+            self.released = True
+            self.broker._release()
+
+
+broker = EventBroker()
@@ -1,55 +1,26 @@
-import sqlite3
+import argparse
+import csv
 import hashlib
-import time
+import json
 import random
-# Removed 'string' as random strings are no longer used.
+import time
 
-DB_NAME = "blockchain.db"
+import database
 
-def create_user(username, password, role="user"):
-    """
-    Creates a new user in the database with a hashed password.
-    Returns True on success, False if the username already exists.
-    """
-    try:
-        conn = sqlite3.connect(DB_NAME)
-        c = conn.cursor()
-        pwd_hash = hashlib.sha256(password.encode()).hexdigest()
-        c.execute("INSERT INTO users (username, password_hash, role, created_at) VALUES (?, ?, ?, ?)",
-                  (username, pwd_hash, role, time.time()))
-        conn.commit()
-        conn.close()
-        return True
-    except sqlite3.IntegrityError:
-        # Username already exists (UNIQUE constraint violation)
-        if conn:
-            conn.close()
-        return False
-    except Exception as e:
-        print(f"Error creating user {username}: {e}")
-        if conn:
-            conn.close()
-        return False
-
-def add_initial_transaction(sender, receiver, energy, price):
-    """
-    Adds a transaction to the DB with 'pending' status for initial mining.
-    Used to initialize user balances (from 'system').
-    """
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("INSERT INTO transactions (seller, buyer, energy, price, status, timestamp) VALUES (?, ?, ?, ?, ?, ?)",
-              (sender, receiver, energy, price, "pending", time.time()))
-    conn.commit()
-    conn.close()
-
-def generate_users(num_users=1000, common_password="1234"):
+# Rows per executemany call, and rows per committed transaction
+BATCH_SIZE = 10000
+COMMIT_EVERY = 200000
+
+
+def hash_password(password):
+    return hashlib.sha256(password.encode()).hexdigest()
+
+
+def generate_user_rows(num_users=1000, common_password="1234"):
     """
-    Generates a specified number of users with sequential usernames and initial balances.
-    The default password is now "1234".
+    Yields (username, password_hash, role, energy, currency) for num_users
+    sequentially named users with random roles and initial allocations.
     """
-    print(f"Generating {num_users} users with password '{common_password}' and initial balances...")
-    
     user_roles = ["consumer", "producer", "prosumer"] 
     
     role_allocations = {
@@ -58,6 +29,8 @@ def generate_users(num_users=1000, common_password="1234"):
         "prosumer": {"energy": random.uniform(100, 500), "currency": random.uniform(200, 800)},
         "admin": {"energy": 0, "currency": 0} 
     }
+    rounded_allocations = {role: (round(alloc["energy"], 2), round(alloc["currency"], 2))
+                           for role, alloc in role_allocations.items()}
 
     # Counters for sequential naming (e.g., producer_0001)
     role_counters = {
@@ -67,75 +40,136 @@ def generate_users(num_users=1000, common_password="1234"):
         "admin": 0
     }
 
-    common_password_hash = hashlib.sha256(common_password.encode()).hexdigest()
+    common_password_hash = hash_password(common_password)
 
     # Determine how many admins to generate (max 5, or 1% of total users)
     num_admins_to_generate = min(num_users // 100, 5) 
-    
-    # List to track which roles still need users to be created
-    roles_remaining = list(user_roles)
+    admin_interval = num_users // (num_admins_to_generate + 1) if num_admins_to_generate > 0 else num_users + 1
     
     for i in range(num_users):
-        current_role = random.choice(roles_remaining)
+        current_role = random.choice(user_roles)
         
         # Admin generation logic: Assign admin role periodically until limit is hit
-        if role_counters["admin"] < num_admins_to_generate and i % (num_users // (num_admins_to_generate + 1) if num_admins_to_generate > 0 else num_users + 1) == 0:
+        if role_counters["admin"] < num_admins_to_generate and i % admin_interval == 0:
             current_role = "admin"
         
         # Increment counter and generate sequential username (4-digit padding)
         role_counters[current_role] += 1
-        count = role_counters[current_role]
-        username = f"{current_role}_{count:04d}"
+        username = f"{current_role}_{role_counters[current_role]:04d}"
         
-        
-        if create_user(username, common_password, current_role):
-            print(f"Created user: {username} (Role: {current_role})")
-            
-            if current_role != "admin":
-                alloc = role_allocations[current_role]
-                initial_energy = round(alloc["energy"], 2)
-                initial_currency = round(alloc["currency"], 2)
-                
-                # Add pending transactions from 'system' to the new user
-                if initial_currency > 0:
-                    # System transfers currency to the user
-                    add_initial_transaction("system", username, 0, initial_currency)
-                    print(f"  -> Added pending currency tx: system -> {username} (${initial_currency:.2f})")
-                if initial_energy > 0:
-                    # System transfers energy to the user
-                    add_initial_transaction("system", username, initial_energy, 0)
-                    print(f"  -> Added pending energy tx: system -> {username} ({initial_energy:.2f} kWh)")
+        initial_energy, initial_currency = rounded_allocations[current_role]
+        yield username, common_password_hash, current_role, initial_energy, initial_currency
+
+
+def read_user_rows(path, default_password="1234"):
+    """
+    Yields the same rows as generate_user_rows from a .csv (with a header row)
+    or .jsonl file. Fields: username, role, and optionally password, energy, currency.
+    """
+    default_hash = hash_password(default_password)
+    
+    with open(path, newline="") as f:
+        if path.endswith(".jsonl"):
+            records = (json.loads(line) for line in f if line.strip())
         else:
-            print(f"Failed to create user: {username} (might already exist)")
-            
-    print(f"\nFinished generating {num_users} users and initial pending transactions.")
-    print("Next step: Run your Flask application (app.py) to mine these initial transactions into blocks.")
+            records = csv.DictReader(f)
+        
+        for record in records:
+            password = record.get("password")
+            yield (record["username"],
+                   hash_password(password) if password else default_hash,
+                   record.get("role") or "user",
+                   float(record.get("energy") or 0),
+                   float(record.get("currency") or 0))
 
-if __name__ == "__main__":
-    # --- Database Initialization (Ensures tables and 'system' user exist) ---
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS blocks
-                 (id INTEGER PRIMARY KEY, hash TEXT, miner TEXT, data TEXT, difficulty INTEGER)''')
-    c.execute('''CREATE TABLE IF NOT EXISTS transactions
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  seller TEXT, buyer TEXT, energy REAL, price REAL, status TEXT, timestamp REAL)''')
-    c.execute('''CREATE TABLE IF NOT EXISTS users
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  username TEXT UNIQUE, password_hash TEXT, role TEXT, created_at REAL)''')
-    c.execute('''CREATE TABLE IF NOT EXISTS contracts
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  contract_type TEXT, params TEXT, creator TEXT, created_at REAL)''')
+
+def _insert_batch(c, batch):
+    # Skip users that already exist, and their allocations with them
+    names = list(dict.fromkeys(row[0] for row in batch))
+    c.execute("SELECT username FROM users WHERE username IN (%s)" % ",".join("?" * len(names)), names)
+    existing = {r[0] for r in c.fetchall()}
+    
+    now = time.time()
+    users, allocations, seen = [], [], set()
+    for username, password_hash, role, energy, currency in batch:
+        if username in existing or username in seen:
+            continue
+        seen.add(username)
+        users.append((username, password_hash, role, now))
+        if role != "admin":
+            # Pending transfers from 'system', mined into a block when the app starts
+            if currency > 0:
+                allocations.append(("system", username, 0, currency, "pending", now))
+            if energy > 0:
+                allocations.append(("system", username, energy, 0, "pending", now))
+    
+    c.executemany("INSERT INTO users (username, password_hash, role, created_at) VALUES (?, ?, ?, ?)", users)
+    c.executemany("INSERT INTO transactions (seller, buyer, energy, price, status, timestamp) VALUES (?, ?, ?, ?, ?, ?)",
+                  allocations)
+    
+    role_counts = {}
+    for user in users:
+        role_counts[f"users:{user[2]}"] = role_counts.get(f"users:{user[2]}", 0) + 1
+    database.increment_counters(c, {**role_counts, "tx:pending": len(allocations)})
+    database.adjust_reservations(c, {"system": sum(row[2] for row in allocations)})
+    return len(users), len(allocations), len(batch) - len(users)
+
+
+def bulk_load(rows, batch_size=BATCH_SIZE, commit_every=COMMIT_EVERY):
+    """
+    Inserts users and their pending initial allocations from an iterable of
+    (username, password_hash, role, energy, currency) rows, batch_size rows per
+    executemany and commit_every rows per transaction. Returns the totals.
+    """
+    totals = {"users": 0, "allocations": 0, "skipped": 0}
+    rows = iter(rows)
+    done = False
+    
+    while not done:
+        with database.transaction() as c:
+            for _ in range(max(commit_every // batch_size, 1)):
+                batch = [row for _, row in zip(range(batch_size), rows)]
+                if not batch:
+                    done = True
+                    break
+                users, allocations, skipped = _insert_batch(c, batch)
+                totals["users"] += users
+                totals["allocations"] += allocations
+                totals["skipped"] += skipped
     
-    # Ensure 'system' user exists for initial balance creation
-    c.execute("SELECT COUNT(*) FROM users WHERE username='system'")
-    if c.fetchone()[0] == 0:
-        # 'system' user does not need a password
-        c.execute("INSERT INTO users (username, password_hash, role, created_at) VALUES (?, ?, ?, ?)",
-                  ("system", "", "system", time.time()))
-    conn.commit()
-    conn.close()
-    # -----------------------------------------------------------------------
-
-    # Call the generator with the requested password
-    generate_users(1000, "1234")
+    return totals
+
+
+def generate_users(num_users=1000, common_password="1234", batch_size=BATCH_SIZE):
+    """
+    Generates a specified number of users with sequential usernames and initial balances.
+    The default password is now "1234".
+    """
+    print(f"Generating {num_users} users with password '{common_password}' and initial balances...")
+    
+    totals = bulk_load(generate_user_rows(num_users, common_password), batch_size)
+    
+    print(f"Created {totals['users']} users with {totals['allocations']} pending allocation transactions "
+          f"({totals['skipped']} already existed).")
+    print("Next step: run bootstrap.py, or start the server with gunicorn (which runs it from on_starting), "
+          "to mine these initial transactions into blocks.")
+    return totals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Provision users and their initial energy/currency allocations.")
+    parser.add_argument("--users", type=int, default=1000, help="number of synthetic users to generate")
+    parser.add_argument("--password", default="1234", help="password for generated users, and the default for imported ones")
+    parser.add_argument("--input", help="load users from a .csv or .jsonl file instead of generating them")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    # Ensures tables, migrations and the 'system' user exist
+    database.init_db()
+
+    if args.input:
+        totals = bulk_load(read_user_rows(args.input, args.password), args.batch_size)
+        print(f"Loaded {totals['users']} users with {totals['allocations']} pending allocation transactions "
+              f"({totals['skipped']} already existed).")
+    else:
+        generate_users(args.users, args.password, args.batch_size)
@@ -0,0 +1,20 @@
+import os
+
+import bootstrap
+
+worker_class = "gthread"
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+threads = 64
+
+# Thread budget per worker: every open /events stream pins one of the 64
+# threads for as long as the browser stays on the page, so events.py accepts
+# at most SSE_MAX_SUBSCRIBERS (default 16) streams per worker and answers 503
+# past that. Those dashboards poll /events/poll instead, which leaves at least
+# 48 threads per worker for /login, /add_tx, /mine and the rest. Raise workers
+# (WEB_CONCURRENCY) rather than the SSE cap to serve more live dashboards.
+
+
+def on_starting(server):
+    # Runs once in the master before any worker is forked, so workers only
+    # import the app and are ready straight away
+    bootstrap.bootstrap()
@@ -0,0 +1,29 @@
+"""
+The shared pool of pending trades. The pool is simply the pending rows of the
+transactions table, so every worker process sees the same one, and the
+reservations table tracks how much energy each seller already has committed
+to it. A trade is admitted only against confirmed balance minus that
+reservation, so sellers can't overspend with trades that each pass alone.
+"""
+from database import transaction, add_transactions, get_user_balances, get_reservations
+from smart_contracts import validate_contracts, get_contract_book
+
+def admit(txs):
+    """
+    Validate trades ({seller, buyer, energy, price[, fee]}), including against
+    the stored contracts binding their parties, and add the valid ones to the
+    pool. Balances and reservations are read under the same write lock as the
+    insert, so concurrent submissions from any worker are serialized; each
+    lookup is a primary-key probe. Returns (valid, message, tx_id) per trade,
+    in order, with tx_id None for rejected trades.
+    """
+    with transaction():
+        sellers = {tx["seller"] for tx in txs}
+        reserved = get_reservations(sellers)
+        available = {seller: {"energy": balance["energy"] - reserved.get(seller, 0)}
+                     for seller, balance in get_user_balances(sellers).items()}
+        
+        verdicts = validate_contracts(txs, available, get_contract_book())
+        tx_ids = iter(add_transactions([tx for tx, (valid, _) in zip(txs, verdicts) if valid], "pending"))
+    
+    return [(valid, msg, next(tx_ids) if valid else None) for valid, msg in verdicts]
@@ -0,0 +1,57 @@
+import hashlib
+import json
+
+# Leaves and inner nodes are hashed with different prefixes so an inner node
+# can never be passed off as a transaction (second-preimage protection)
+LEAF_PREFIX = b"\x00"
+NODE_PREFIX = b"\x01"
+
+
+def hash_leaf(tx):
+    encoded_tx = json.dumps(tx, sort_keys=True).encode()
+    return hashlib.sha256(LEAF_PREFIX + encoded_tx).hexdigest()
+
+
+def hash_node(left, right):
+    return hashlib.sha256(NODE_PREFIX + bytes.fromhex(left) + bytes.fromhex(right)).hexdigest()
+
+
+def merkle_root(txs):
+    # An odd node at any level is paired with itself, as in Bitcoin. That makes
+    # [a, b, c] and [a, b, c, c] share a root (CVE-2012-2459), so as in Bitcoin
+    # a list with a repeated transaction has no root at all.
+    if not txs:
+        return hashlib.sha256(b"").hexdigest()
+
+    level = [hash_leaf(tx) for tx in txs]
+    if len(set(level)) != len(level):
+        raise ValueError("duplicate transactions")
+    while len(level) > 1:
+        if len(level) % 2:
+            level.append(level[-1])
+        level = [hash_node(level[i], level[i + 1]) for i in range(0, len(level), 2)]
+    return level[0]
+
+
+def merkle_proof(txs, position):
+    """
+    Sibling hashes from the leaf at `position` up to the root, each tagged with
+    the side it sits on. The proof has one entry per tree level, O(log n).
+    """
+    level = [hash_leaf(tx) for tx in txs]
+    proof = []
+    while len(level) > 1:
+        if len(level) % 2:
+            level.append(level[-1])
+        sibling = position ^ 1
+        proof.append({"hash": level[sibling], "side": "left" if sibling < position else "right"})
+        level = [hash_node(level[i], level[i + 1]) for i in range(0, len(level), 2)]
+        position //= 2
+    return proof
+
+
+def verify_proof(tx, proof, root):
+    h = hash_leaf(tx)
+    for step in proof:
+        h = hash_node(step["hash"], h) if step["side"] == "left" else hash_node(h, step["hash"])
+    return h == root
@@ -0,0 +1,198 @@
+"""
+In-process instrumentation: counters and histograms rendered in the
+Prometheus text exposition format at /metrics.
+
+Metrics live in each process's memory, so under gunicorn a scrape only sees
+the worker that answered it. Every series carries that worker's pid label;
+sum across pids in the query.
+"""
+import cProfile
+import functools
+import os
+import random
+import re
+import secrets
+import threading
+import time
+
+# Request latency buckets, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Single SQLite calls are mostly well under a millisecond
+DB_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1, 5)
+
+# Opt-in profiling: with PROFILE_DIR set, a PROFILE_SAMPLE_RATE fraction of
+# requests are run under cProfile and dumped there as
+# <endpoint>-<time>-<pid>.prof, for pstats or snakeviz. Profiling a request on
+# demand costs the server far more than serving it, so the "X-Profile" header
+# is only honoured as "X-Profile: 1" from an admin session, or carrying the
+# PROFILE_TOKEN secret (for scripts without a session).
+PROFILE_DIR = os.environ.get("PROFILE_DIR")
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+PROFILE_TOKEN = os.environ.get("PROFILE_TOKEN")
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    labels = {"pid": os.getpid(), **labels}
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_format_labels(dict(zip(self.labelnames, key)))} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.lock = threading.Lock()
+        # label values -> [per-bucket counts (non-cumulative, last is +Inf), sum, count]
+        self.values = {}
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        i = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        with self.lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, **labels):
+        """Context manager observing the seconds spent inside it"""
+        return _Timer(self, labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, (counts, total, count) in sorted(self.values.items()):
+                labels = dict(zip(self.labelnames, key))
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                    cumulative += bucket_count
+                    lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': bound})} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(labels)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+def render():
+    """Every registered metric in Prometheus text format"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+http_request_seconds = Histogram("http_request_duration_seconds", "Time to produce a response, by route",
+                                 ("method", "endpoint", "status"))
+db_call_seconds = Histogram("db_call_duration_seconds", "Time spent in each database.py function",
+                            ("function",), buckets=DB_BUCKETS)
+db_call_errors = Counter("db_call_errors_total", "database.py calls that raised", ("function",))
+pow_seconds = Histogram("pow_mining_duration_seconds", "Proof-of-work search time per block", ("difficulty",))
+pow_hash_attempts = Counter("pow_hash_attempts_total", "Nonces tried by mine_block, by difficulty", ("difficulty",))
+chain_validation_seconds = Histogram("chain_validation_duration_seconds", "Time to validate the stored chain",
+                                     ("mode",))
+chain_validated_blocks = Counter("chain_validated_blocks_total", "Blocks checked by chain validation")
+
+
+def timed_db_call(fn):
+    """Wrap a database.py function so every call lands in db_call_duration_seconds"""
+    name = fn.__name__
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            db_call_errors.inc(function=name)
+            raise
+        finally:
+            db_call_seconds.observe(time.perf_counter() - start, function=name)
+    return wrapper
+
+
+def _profile_path(endpoint):
+    safe = re.sub(r"[^A-Za-z0-9_.-]", "_", endpoint or "unknown")
+    return os.path.join(PROFILE_DIR, f"{safe}-{time.time():.6f}-{os.getpid()}.prof")
+
+
+def _profile_requested(header, role):
+    if header is None:
+        return False
+    if header == "1":
+        return role == "admin"
+    return PROFILE_TOKEN is not None and secrets.compare_digest(header.encode(), PROFILE_TOKEN.encode())
+
+
+def instrument_app(app):
+    """Time every request into http_request_duration_seconds and run the opt-in profiler"""
+    from flask import g, request, session
+
+    @app.before_request
+    def _start_request():
+        g.request_start = time.perf_counter()
+        if PROFILE_DIR and (_profile_requested(request.headers.get("X-Profile"), session.get("role"))
+                            or random.random() < PROFILE_SAMPLE_RATE):
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+
+    @app.after_request
+    def _finish_request(response):
+        start = g.pop("request_start", None)
+        if start is not None:
+            # Unmatched URLs share one series rather than one per path
+            http_request_seconds.observe(time.perf_counter() - start, method=request.method,
+                                         endpoint=request.endpoint or "unmatched", status=response.status_code)
+        return response
+
+    @app.teardown_request
+    def _stop_profiler(exc):
+        # Teardown runs even when the view raised, so the profiler never stays enabled
+        profiler = g.pop("profiler", None)
+        if profiler is not None:
+            profiler.disable()
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            profiler.dump_stats(_profile_path(request.endpoint))
@@ -0,0 +1,110 @@
+import sqlite3
+import threading
+import uuid
+
+from blockchain import calculate_difficulty, mine_block, split_into_blocks
+from chain_cache import chain_cache
+from database import (acquire_lock, add_block, claim_mining_job, confirm_transactions, fail_abandoned_mining_jobs,
+                      finish_mining_job, get_mining_job, get_pending_transactions, has_queued_mining_job,
+                      new_lock_owner, renewing_lock, submit_mining_job, transaction)
+
+LOCK_NAME = "mining"
+# Seconds the mining lease lasts without renewal; renewed while a job runs
+LOCK_TTL = 30
+# How often each process's mining thread looks for jobs queued by any worker
+POLL_INTERVAL = 1.0
+
+
+class MiningQueue:
+    """
+    Runs mining jobs one at a time in the background so /mine can return
+    immediately. Jobs live in the mining_jobs table, so a status poll can land
+    on any worker, and requests from every worker that arrive while a job is
+    still waiting to start are folded into that job, so at most one block is
+    mined per height.
+
+    Every process that has accepted a /mine request runs a thread polling for
+    queued jobs; the one holding the "mining" lease runs them. A lease that
+    lapses with its process lets another take over, failing the job it left.
+    """
+
+    def __init__(self, mine_fn):
+        self.mine_fn = mine_fn
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.thread = None
+
+    def submit(self, miner):
+        """Queue a job for miner, or join the one already waiting. Returns (job, coalesced)."""
+        job, coalesced = submit_mining_job(uuid.uuid4().hex, miner)
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                # Started lazily so the thread is created in the serving process, after any fork
+                self.thread = threading.Thread(target=self._run, name="mining-worker", daemon=True)
+                self.thread.start()
+        self.wake.set()
+        return job, coalesced
+
+    def get(self, job_id):
+        return get_mining_job(job_id)
+
+    def _run(self):
+        owner = new_lock_owner()
+        while True:
+            self.wake.wait(POLL_INTERVAL)
+            self.wake.clear()
+            try:
+                if has_queued_mining_job() and acquire_lock(LOCK_NAME, owner, LOCK_TTL):
+                    with renewing_lock(LOCK_NAME, owner, LOCK_TTL):
+                        fail_abandoned_mining_jobs()
+                        while (job := claim_mining_job()) is not None:
+                            self._execute(job)
+            except Exception as e:
+                # Keep polling; the next round retries whatever is still queued
+                print(f"Mining worker error: {e}")
+
+    def _execute(self, job):
+        try:
+            result = self.mine_fn(job["miner"])
+        except Exception as e:
+            print(f"Mining job {job['id']} failed: {e}")
+            result = {"error": str(e)}
+        finish_mining_job(job["id"], "failed" if "error" in result else "done", result)
+
+
+def mine_pending_blocks(miner):
+    """
+    Drains the pending pool into successive size-capped blocks mined by miner
+    and returns the blocks that were added to the chain.
+    """
+    mined = []
+    conflicts = 0
+    batches = split_into_blocks(get_pending_transactions())
+    
+    while batches:
+        txs = batches[0]
+        tip = chain_cache.get_tip()
+        height = tip["index"] + 1 if tip else 0
+        difficulty = calculate_difficulty(height)
+        
+        block = mine_block(txs, miner, height, tip["hash"] if tip else "0", difficulty)
+        
+        try:
+            with transaction():
+                add_block(block)
+                if confirm_transactions([tx["id"] for tx in txs], block["index"]) != len(txs):
+                    raise sqlite3.IntegrityError("Transactions already confirmed in another block")
+        except sqlite3.IntegrityError as e:
+            # Another worker process committed this height, or some of these
+            # transactions, first: start again from the new tip and pool
+            print(f"Block {block['index']} conflicts with the stored chain ({e}), retrying on the new tip")
+            conflicts += 1
+            if conflicts >= 3:
+                raise RuntimeError("Chain tip kept moving while mining, try again.")
+            batches = split_into_blocks(get_pending_transactions())
+            continue
+        
+        mined.append(block)
+        batches.pop(0)
+    
+    return mined
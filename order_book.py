@@ -0,0 +1,205 @@
+import heapq
+import math
+import threading
+
+import database
+from mempool import admit
+from smart_contracts import INSUFFICIENT_ENERGY
+
+# Every fill must pass validate_contracts, so orders are held to the same bounds
+MAX_PRICE_PER_KWH = 10
+MIN_QUANTITY = 1
+
+SIDES = ("bid", "ask")
+
+
+class OrderBook:
+    """
+    In-memory bids and asks, each side a heap in price-time priority (best
+    price first, then lowest order id). Removed orders are dropped from the
+    heaps lazily, when they surface at the top.
+    """
+
+    def __init__(self, orders=()):
+        self.orders = {}
+        self.heaps = {"bid": [], "ask": []}
+        for order in orders:
+            self.add(order)
+
+    def add(self, order):
+        self.orders[order["id"]] = order
+        # Highest bid first, lowest ask first
+        key = -order["price"] if order["side"] == "bid" else order["price"]
+        heapq.heappush(self.heaps[order["side"]], (key, order["id"]))
+
+    def remove(self, order_id):
+        return self.orders.pop(order_id, None)
+
+    def best(self, side):
+        """The best open order on side, or None"""
+        heap = self.heaps[side]
+        while heap and heap[0][1] not in self.orders:
+            heapq.heappop(heap)
+        return self.orders[heap[0][1]] if heap else None
+
+    def pop_best(self, side):
+        order = self.best(side)
+        if order is not None:
+            heapq.heappop(self.heaps[side])
+            del self.orders[order["id"]]
+        return order
+
+    def depth(self, side, levels=10):
+        """[{"price", "quantity", "orders"}] for the best `levels` price levels on side"""
+        totals = {}
+        for order in self.orders.values():
+            if order["side"] == side:
+                level = totals.setdefault(order["price"], [0, 0])
+                level[0] += order["remaining"]
+                level[1] += 1
+        prices = sorted(totals, reverse=(side == "bid"))[:levels]
+        return [{"price": price, "quantity": totals[price][0], "orders": totals[price][1]} for price in prices]
+
+
+def _crosses(order, resting):
+    return resting["price"] <= order["price"] if order["side"] == "bid" else resting["price"] >= order["price"]
+
+
+class MatchingEngine:
+    """
+    Matches limit orders continuously against this process's OrderBook. Each
+    fill, at the resting order's price, is admitted to the pending pool as a
+    transaction, so it passes the same contract rules as /add_tx.
+
+    Open orders are written through to the orders table in the same transaction
+    as the match, which is how the book survives a restart. Every change bumps
+    the stored order book version; when another worker has matched since this
+    process last looked, the book is reloaded from the table first. Matching
+    runs under SQLite's write lock, so it is serialized across workers.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.book = None
+        self.version = None
+        self.db_name = None
+
+    def _current_book(self):
+        version = database.get_order_book_version()
+        if self.book is None or self.version != version or self.db_name != database.DB_NAME:
+            self.book = OrderBook(database.get_open_orders())
+            self.version = version
+            self.db_name = database.DB_NAME
+        return self.book
+
+    def submit(self, username, side, price, quantity):
+        """
+        Place a limit order (price per kWh) and match it. Returns (order, fills);
+        any unfilled remainder rests in the book. Raises ValueError if the order
+        is out of bounds or an ask exceeds the seller's available energy.
+        """
+        if side not in SIDES:
+            raise ValueError("side must be bid or ask")
+        # NaN fails every comparison below and Infinity passes the quantity one
+        if not (math.isfinite(price) and math.isfinite(quantity)):
+            raise ValueError("Price and quantity must be finite numbers")
+        if not 0 < price <= MAX_PRICE_PER_KWH:
+            raise ValueError(f"Price must be above $0 and at most ${MAX_PRICE_PER_KWH}/kWh")
+        if quantity < MIN_QUANTITY:
+            raise ValueError(f"Minimum order is {MIN_QUANTITY} kWh")
+
+        with self.lock:
+            try:
+                with database.transaction():
+                    return self._submit(username, side, price, quantity)
+            except BaseException:
+                # The transaction rolled back, so the in-memory book may be ahead of the table
+                self.book = None
+                raise
+
+    def _submit(self, username, side, price, quantity):
+        book = self._current_book()
+        if side == "ask":
+            reserved = database.get_reservations([username]).get(username, 0)
+            if database.get_user_balance(username)["energy"] - reserved < quantity:
+                raise ValueError(INSUFFICIENT_ENERGY)
+
+        order = {"id": database.add_order(username, side, price, quantity), "username": username, "side": side,
+                 "price": price, "quantity": quantity, "remaining": quantity, "status": "open"}
+        opposite = "ask" if side == "bid" else "bid"
+        fills, touched, passed_over = [], [], []
+
+        while order["remaining"] >= MIN_QUANTITY:
+            resting = book.pop_best(opposite)
+            if resting is None:
+                break
+            if not _crosses(order, resting):
+                book.add(resting)
+                break
+            if resting["username"] == username:
+                # No self-trading: skip our own orders without disturbing them
+                passed_over.append(resting)
+                continue
+
+            energy = min(order["remaining"], resting["remaining"])
+            bid, ask = (order, resting) if side == "bid" else (resting, order)
+            tx = {"seller": ask["username"], "buyer": bid["username"], "energy": energy,
+                  "price": round(energy * resting["price"], 6)}
+            [(valid, msg, tx_id)] = admit([tx])
+            if not valid:
+                if ask is resting and msg == INSUFFICIENT_ENERGY:
+                    # The seller no longer has the energy behind this ask
+                    resting["status"] = "cancelled"
+                    touched.append(resting)
+                else:
+                    # A contract rules out this pairing only; the order stays for others
+                    passed_over.append(resting)
+                continue
+
+            fills.append(dict(tx, id=tx_id, bid_id=bid["id"], ask_id=ask["id"], price_per_kwh=resting["price"]))
+            order["remaining"] -= energy
+            resting["remaining"] -= energy
+            touched.append(resting)
+            if resting["remaining"] >= MIN_QUANTITY:
+                book.add(resting)
+            else:
+                resting["status"] = "filled"
+
+        for resting in passed_over:
+            book.add(resting)
+        # A remainder too small to trade can never fill, so it closes with the order
+        if order["remaining"] >= MIN_QUANTITY:
+            book.add(order)
+        else:
+            order["status"] = "filled"
+
+        database.update_orders([(o["remaining"], o["status"], o["id"]) for o in touched + [order]])
+        self.version = database.bump_order_book_version()
+        return order, fills
+
+    def cancel(self, order_id, username):
+        """Cancel one of username's open orders; returns the order, or None if they have no such open order"""
+        with self.lock:
+            try:
+                with database.transaction():
+                    order = database.get_order(order_id)
+                    if order is None or order["username"] != username or order["status"] != "open":
+                        return None
+                    book = self._current_book()
+                    book.remove(order_id)
+                    order["status"] = "cancelled"
+                    database.update_orders([(order["remaining"], order["status"], order_id)])
+                    self.version = database.bump_order_book_version()
+                    return order
+            except BaseException:
+                self.book = None
+                raise
+
+    def depth(self, levels=10):
+        """Aggregated price levels for both sides of the current book"""
+        with self.lock:
+            book = self._current_book()
+            return {"bids": book.depth("bid", levels), "asks": book.depth("ask", levels)}
+
+
+engine = MatchingEngine()
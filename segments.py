@@ -0,0 +1,100 @@
+"""
+Append-only segment files holding archived block bodies. Each record is one
+block's transaction JSON, zlib-compressed on its own so it can be read back
+from its (segment, offset, length) alone; that index lives in SQLite
+(archive_index), next to the headers.
+
+Records are only ever appended, and a record is only referenced once the
+segment has been synced, so bytes left at a segment's end by a crashed
+archiver are simply never read.
+"""
+import mmap
+import os
+import threading
+import zlib
+
+MAGIC = b"PYBSEG1\n"
+# A new segment is started once the current one reaches this size
+MAX_SEGMENT_BYTES = 64 * 1024 * 1024
+
+
+def segment_path(directory, number):
+    return os.path.join(directory, f"segment-{number:06d}.zz")
+
+
+def last_segment(directory):
+    """Number of the highest existing segment in directory, or 0 if there are none"""
+    if not os.path.isdir(directory):
+        return 0
+    numbers = [int(name[8:14]) for name in os.listdir(directory)
+               if name.startswith("segment-") and name.endswith(".zz") and name[8:14].isdigit()]
+    return max(numbers, default=0)
+
+
+class SegmentWriter:
+    """Appends compressed records to the newest segment in directory, starting new ones as they fill"""
+
+    def __init__(self, directory, max_bytes=MAX_SEGMENT_BYTES, level=9):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.level = level
+        os.makedirs(directory, exist_ok=True)
+        self.segment = max(last_segment(directory), 1)
+        self.file = self._open(self.segment)
+
+    def _open(self, number):
+        f = open(segment_path(self.directory, number), "ab")
+        if f.tell() == 0:
+            f.write(MAGIC)
+        return f
+
+    def append(self, data):
+        """Compress data (bytes) into the current segment; returns its (segment, offset, length)"""
+        record = zlib.compress(data, self.level)
+        if self.file.tell() + len(record) > self.max_bytes and self.file.tell() > len(MAGIC):
+            self.sync()
+            self.file.close()
+            self.segment += 1
+            self.file = self._open(self.segment)
+        offset = self.file.tell()
+        self.file.write(record)
+        return self.segment, offset, len(record)
+
+    def sync(self):
+        """Make everything appended so far durable; call before recording its offsets"""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        self.sync()
+        self.file.close()
+
+
+class SegmentReader:
+    """
+    Reads records through a memory map of each segment, kept open per process,
+    so only the pages holding the requested records are paged in. A map is
+    re-made when a record lies past its end, i.e. the segment has grown since.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.maps = {}
+
+    def _map(self, path, end):
+        with self.lock:
+            mapped = self.maps.get(path)
+            if mapped is None or len(mapped) < end:
+                with open(path, "rb") as f:
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                # Readers holding the old map keep it alive until they finish with it
+                self.maps[path] = mapped
+            return mapped
+
+    def read(self, directory, segment, offset, length):
+        """The decompressed record at offset in segment, as bytes"""
+        path = segment_path(directory, segment)
+        return zlib.decompress(self._map(path, offset + length)[offset:offset + length])
+
+
+reader = SegmentReader()
@@ -1,29 +1,182 @@
-import time
+import abc
+import math
+import threading
+
+import database
+
+INSUFFICIENT_ENERGY = "Insufficient energy balance"
 
 def validate_contract(transaction, seller_balance):
     """Validate transaction against smart contract rules"""
+    return validate_contracts([transaction], {transaction["seller"]: seller_balance})[0]
+
+def validate_contracts(transactions, seller_balances, contracts=None):
+    """
+    Validate a batch of transactions against the built-in rules (seller has the
+    energy, at most $10/kWh, at least 1 kWh, no self-trading) in one pass.
+    seller_balances maps each seller to their balance snapshot; energy accepted
+    earlier in the batch is deducted from it, so a seller can't spend the same
+    balance twice. contracts, a ContractBook, adds the stored contracts binding
+    each trade's parties on top. Returns one (valid, message) pair per transaction.
+    """
+    spent = {}
+    results = []
     
-    # Rule 1: Seller must have enough energy
-    if seller_balance["energy"] < transaction["energy"]:
-        return False, "Insufficient energy balance"
-    
-    # Rule 2: Max price per kWh is $10
-    price_per_kwh = transaction["price"] / transaction["energy"]
-    if price_per_kwh > 10:
-        return False, f"Price ${price_per_kwh:.2f}/kWh exceeds max $10/kWh"
+    for tx in transactions:
+        seller, energy = tx["seller"], tx["energy"]
+        available = seller_balances.get(seller, {"energy": 0})["energy"] - spent.get(seller, 0)
+        
+        if available < energy:
+            results.append((False, INSUFFICIENT_ENERGY))
+        elif energy > 0 and tx["price"] / energy > 10:
+            results.append((False, f"Price ${tx['price'] / energy:.2f}/kWh exceeds max $10/kWh"))
+        elif energy < 1:
+            results.append((False, "Minimum transaction is 1 kWh"))
+        elif seller == tx["buyer"]:
+            results.append((False, "Cannot trade with yourself"))
+        elif contracts is not None and (error := contracts.check(tx)):
+            results.append((False, error))
+        else:
+            spent[seller] = spent.get(seller, 0) + energy
+            results.append((True, "Contract validated"))
     
-    # Rule 3: Minimum transaction is 1 kWh
-    if transaction["energy"] < 1:
-        return False, "Minimum transaction is 1 kWh"
+    return results
+
+class Rule(abc.ABC):
+    """A stored contract compiled for evaluation; binds its seller and/or buyer, or every trade if neither"""
+
+    def __init__(self, contract):
+        self.contract_id = contract["id"]
+        self.seller = contract.get("seller")
+        self.buyer = contract.get("buyer")
+        self.params = contract.get("params") or {}
+
+    def number(self, name):
+        value = self.params.get(name)
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value) or value <= 0:
+            raise ValueError(f"{name} must be a positive finite number")
+        return value
+
+    @abc.abstractmethod
+    def check(self, tx):
+        """Why tx breaks this contract, or None if it complies"""
+
+class PriceCap(Rule):
+    """params: {"max_price_per_kwh": n}"""
+
+    def __init__(self, contract):
+        super().__init__(contract)
+        self.max_price = self.number("max_price_per_kwh")
+
+    def check(self, tx):
+        price_per_kwh = tx["price"] / tx["energy"]
+        if price_per_kwh > self.max_price:
+            return f"Price ${price_per_kwh:.2f}/kWh exceeds contract cap ${self.max_price:.2f}/kWh"
+
+class MinSize(Rule):
+    """params: {"min_energy": n}"""
+
+    def __init__(self, contract):
+        super().__init__(contract)
+        self.min_energy = self.number("min_energy")
+
+    def check(self, tx):
+        if tx["energy"] < self.min_energy:
+            return f"Minimum trade under this contract is {self.min_energy} kWh"
+
+class CounterpartyAllowlist(Rule):
+    """params: {"allowed": [usernames]}; binds exactly one party, whose counterparty must be listed"""
+
+    def __init__(self, contract):
+        super().__init__(contract)
+        allowed = self.params.get("allowed")
+        if not isinstance(allowed, list) or not all(isinstance(name, str) for name in allowed):
+            raise ValueError("allowed must be a list of usernames")
+        if (self.seller is None) == (self.buyer is None):
+            raise ValueError("A counterparty allowlist must bind exactly one of seller or buyer")
+        self.allowed = frozenset(allowed)
+
+    def check(self, tx):
+        counterparty = tx["buyer"] if self.seller is not None else tx["seller"]
+        if counterparty not in self.allowed:
+            return f"{counterparty} is not an allowed counterparty"
+
+RULE_TYPES = {
+    "price_cap": PriceCap,
+    "min_size": MinSize,
+    "counterparty_allowlist": CounterpartyAllowlist,
+}
+
+def compile_contract(contract):
+    """Turn a contract dict into its Rule; raises ValueError if the type or params are invalid"""
+    rule_type = RULE_TYPES.get(contract.get("contract_type"))
+    if rule_type is None:
+        raise ValueError(f"Unknown contract type, expected one of: {', '.join(RULE_TYPES)}")
+    for party in ("seller", "buyer"):
+        if contract.get(party) is not None and not isinstance(contract[party], str):
+            raise ValueError(f"{party} must be a username")
+    if contract.get("params") is not None and not isinstance(contract["params"], dict):
+        raise ValueError("params must be an object")
+    return rule_type(contract)
+
+class ContractBook:
+    """
+    Active contracts compiled once and indexed by the party they bind, so a
+    trade only evaluates the global contracts plus those naming its seller or
+    buyer rather than every stored contract.
+    """
+
+    def __init__(self, contracts):
+        self.global_rules = []
+        self.by_seller = {}
+        self.by_buyer = {}
+        for contract in contracts:
+            rule = compile_contract(contract)
+            if rule.seller is not None:
+                self.by_seller.setdefault(rule.seller, []).append(rule)
+            elif rule.buyer is not None:
+                self.by_buyer.setdefault(rule.buyer, []).append(rule)
+            else:
+                self.global_rules.append(rule)
+
+    def rules_for(self, tx):
+        yield from self.global_rules
+        for rule in self.by_seller.get(tx["seller"], ()):
+            if rule.buyer is None or rule.buyer == tx["buyer"]:
+                yield rule
+        yield from self.by_buyer.get(tx["buyer"], ())
+
+    def check(self, tx):
+        """The first contract tx breaks, as a message, or None"""
+        for rule in self.rules_for(tx):
+            error = rule.check(tx)
+            if error:
+                return f"Contract {rule.contract_id}: {error}"
+        return None
+
+_lock = threading.Lock()
+_book = None
+_book_key = None
+
+def get_contract_book():
+    """
+    This process's compiled ContractBook. Contracts are append-only, so it is
+    only rebuilt when the highest contract id changes, whichever worker added it.
+    """
+    global _book, _book_key
     
-    # Rule 4: No self-trading
-    if transaction["seller"] == transaction["buyer"]:
-        return False, "Cannot trade with yourself"
+    key = (database.DB_NAME, database.get_last_contract_id())
+    with _lock:
+        if _book is not None and _book_key == key:
+            return _book
     
-    return True, "Contract validated"
+    book = ContractBook(database.get_contracts(status="active"))
+    with _lock:
+        _book, _book_key = book, key
+    return book
 
 def create_contract(contract):
-    """Create a new smart contract"""
-    contract["created_at"] = time.time()
-    contract["status"] = "active"
-    return contract.get("id", int(time.time()))
+    """Validate and store a new contract, returning its id; raises ValueError if it can't be compiled"""
+    compile_contract(dict(contract, id=None))
+    return database.add_contract(contract["contract_type"], contract.get("params") or {}, contract["creator"],
+                                 contract.get("seller"), contract.get("buyer"))
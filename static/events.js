@@ -0,0 +1,32 @@
+// Live dashboard updates. handlers maps an event type ("block", "pending_tx",
+// "balances") to a function taking the event's data. They arrive over a
+// Server-Sent Events stream when the server has one free, and otherwise by
+// polling /events/poll, which holds no server thread between requests.
+function liveEvents(handlers, pollMs = 5000) {
+    const source = new EventSource("/events");
+    for (const [type, handler] of Object.entries(handlers)) {
+        source.addEventListener(type, (e) => handler(JSON.parse(e.data)));
+    }
+    source.onerror = () => {
+        // EventSource reconnects dropped streams by itself and only gives up
+        // (CLOSED) when the server turns it away
+        if (source.readyState === EventSource.CLOSED) pollEvents(handlers, pollMs);
+    };
+}
+
+async function pollEvents(handlers, pollMs) {
+    let after = null;
+    while (true) {
+        try {
+            const res = await fetch(after === null ? "/events/poll" : `/events/poll?after=${after}`);
+            const data = await res.json();
+            for (const event of data.events) {
+                if (handlers[event.type]) handlers[event.type](event.data);
+            }
+            after = data.last_id;
+        } catch (e) {
+            // Try again next round
+        }
+        await new Promise(resolve => setTimeout(resolve, pollMs));
+    }
+}
@@ -0,0 +1,45 @@
+import threading
+import time
+
+import database
+
+# Dashboards poll /stats; within this window they share one computed snapshot
+STATS_TTL = 2.0
+
+_lock = threading.Lock()
+_cached = None
+_expires = 0
+
+
+def _compute():
+    counters = database.get_counters()
+    blocks = int(counters.get("blocks", 0))
+    tx_by_status = {name[3:]: int(value) for name, value in counters.items() if name.startswith("tx:") and value}
+    users_by_role = {name[6:]: int(value) for name, value in counters.items() if name.startswith("users:") and value}
+
+    return {
+        "total_blocks": blocks,
+        "total_transactions": sum(tx_by_status.values()),
+        "total_users": sum(users_by_role.values()),
+        "pending_txs": tx_by_status.get("pending", 0),
+        "avg_difficulty": counters.get("difficulty_sum", 0) / blocks if blocks else 0,
+        "total_contracts": int(counters.get("contracts", 0)),
+        "transactions_by_status": tx_by_status,
+        "users_by_role": users_by_role
+    }
+
+
+def get_stats():
+    """Chain-wide totals from the counters table, recomputed at most every STATS_TTL seconds"""
+    global _cached, _expires
+
+    now = time.monotonic()
+    with _lock:
+        if _cached is not None and now < _expires:
+            return dict(_cached)
+
+    snapshot = _compute()
+    with _lock:
+        _cached, _expires = snapshot, now + STATS_TTL
+    return dict(snapshot)
+
@@ -0,0 +1,42 @@
+import os
+
+import blockchain
+
+
+def run_in_fork(fn):
+    """Run fn in a forked child, as gunicorn runs a worker; returns the child's exit status"""
+    pid = os.fork()
+    if pid == 0:
+        try:
+            fn()
+            code = 0
+        except BaseException as e:
+            print(f"child failed: {e!r}")
+            code = 1
+        os._exit(code)
+    return os.waitstatus_to_exitcode(os.waitpid(pid, 0)[1])
+
+
+def test_parallel_mining_after_fork():
+    # bootstrap mines in the gunicorn master, which starts the forkserver there before workers fork
+    parent = blockchain.mine_block([], "system", 1, "0" * 64, blockchain.PARALLEL_MIN_DIFFICULTY, workers=2)
+    assert blockchain.validate_chain([parent], prev_hash="0" * 64)[0]
+
+    def mine_in_child():
+        block = blockchain.mine_block([], "miner", 2, parent["hash"], blockchain.PARALLEL_MIN_DIFFICULTY, workers=2)
+        assert blockchain.validate_chain([block], prev_hash=parent["hash"])[0]
+
+    assert run_in_fork(mine_in_child) == 0
+
+
+def test_parallel_validation_after_fork():
+    blocks, prev = [], "0" * 64
+    for i in range(blockchain.PARALLEL_VALIDATION_MIN_BLOCKS):
+        blocks.append(blockchain.mine_block([], "miner", i + 1, prev, 1, workers=1))
+        prev = blocks[-1]["hash"]
+    assert blockchain.validate_chain_parallel(blocks, prev_hash="0" * 64, workers=2) == (True, "Chain valid")
+
+    def validate_in_child():
+        assert blockchain.validate_chain_parallel(blocks, prev_hash="0" * 64, workers=2) == (True, "Chain valid")
+
+    assert run_in_fork(validate_in_child) == 0
@@ -0,0 +1,38 @@
+import json
+
+import database
+from blockchain import mine_block
+
+
+def mine_blocks(count):
+    for _ in range(count):
+        tip = database.get_chain_tip()
+        database.add_block(mine_block([], "miner", tip["index"] + 1, tip["hash"], 1, workers=1))
+
+
+def verify(full):
+    import app
+    return app.verify_stored_chain(full=full)
+
+
+def test_trusted_base_is_recorded_once(db):
+    mine_blocks(3)
+    assert database.get_trusted_base() == (0, "genesis")
+    db.execute("UPDATE blocks SET nonce = NULL WHERE id = 2")
+    db.commit()
+    assert database.get_trusted_base() == (0, "genesis")
+
+
+def test_block_without_nonce_above_base_is_rejected(db):
+    mine_blocks(3)
+    assert verify(full=True)[0]
+
+    # Rewrite a mined block's body and drop its nonce, so it looks like a legacy block
+    db.execute("UPDATE blocks SET nonce = NULL, merkle_root = NULL WHERE id = 2")
+    db.execute("UPDATE block_bodies SET data = ? WHERE block_id = 2",
+               (json.dumps([{"seller": "system", "buyer": "miner", "energy": 1000, "price": 0}]),))
+    db.commit()
+
+    for full in (False, True):
+        assert verify(full) == (False, "Block 2 has no proof of work above the trusted base")
+    assert database.get_chain_checkpoint() is None
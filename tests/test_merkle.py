@@ -0,0 +1,31 @@
+import pytest
+
+import blockchain
+from merkle import merkle_proof, merkle_root, verify_proof
+
+
+def txs(count):
+    return [{"id": i, "seller": "system", "buyer": f"user_{i}", "energy": i + 1, "price": 0} for i in range(count)]
+
+
+@pytest.mark.parametrize("count", [1, 2, 3, 4, 5, 7, 8, 13])
+def test_proof_round_trip(count):
+    data = txs(count)
+    root = merkle_root(data)
+    for position, tx in enumerate(data):
+        assert verify_proof(tx, merkle_proof(data, position), root)
+    assert not verify_proof(dict(data[0], energy=999), merkle_proof(data, 0), root)
+
+
+def test_repeated_last_transaction_has_no_root():
+    a, b, c = txs(3)
+    with pytest.raises(ValueError):
+        merkle_root([a, b, c, c])
+
+
+def test_block_with_repeated_transaction_is_rejected():
+    # Same header and root as the mined block, one transaction counted twice
+    block = blockchain.mine_block(txs(3), "miner", 1, "0" * 64, 1, workers=1)
+    assert blockchain.validate_chain([block], prev_hash="0" * 64)[0]
+    mutated = dict(block, data=block["data"] + block["data"][-1:])
+    assert blockchain.validate_chain([mutated], prev_hash="0" * 64) == (False, "Block 1 contains duplicate transactions")
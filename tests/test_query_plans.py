@@ -0,0 +1,99 @@
+"""
+Every hot query must be served by an index: no full table scans and no temp
+B-tree sorts. The statements checked are captured from the connection while
+each hot path runs, so the plans are those of the SQL the code ships.
+"""
+import pytest
+
+import database
+from blockchain import mine_block
+
+
+def seed():
+    """A user pair, one mined block with a trade in it, a pending trade, a contract and an order"""
+    database.create_user("producer_0001", "pw", "producer")
+    database.create_user("consumer_0001", "pw", "consumer")
+    txs = [{"seller": "system", "buyer": "producer_0001", "energy": 100, "price": 0},
+           {"seller": "producer_0001", "buyer": "consumer_0001", "energy": 5, "price": 20}]
+    ids = database.add_transactions(txs, "pending")
+    tip = database.get_chain_tip()
+    block = mine_block([dict(tx, id=tx_id, fee=0) for tx, tx_id in zip(txs, ids)], "system", tip["index"] + 1,
+                       tip["hash"], 1, workers=1)
+    with database.transaction():
+        database.add_block(block)
+        database.confirm_transactions(ids, block["index"])
+    database.add_transaction("producer_0001", "consumer_0001", 2, 8, "pending")
+    database.add_contract("price_cap", {"max_price_per_kwh": 5}, "admin", seller="producer_0001")
+    database.add_order("producer_0001", "ask", 6, 10)
+
+
+def client():
+    import app
+    c = app.app.test_client()
+    with c.session_transaction() as session:
+        session["user"], session["role"] = "admin", "admin"
+    return c
+
+
+HOT_PATHS = {
+    "get_pending_transactions": lambda: database.get_pending_transactions(),
+    "get_all_transactions": lambda: database.get_all_transactions(),
+    "confirm_transactions": lambda: database.confirm_transactions([3], 1),
+    "get_reservations": lambda: database.get_reservations(["producer_0001"]),
+    "get_user_balances": lambda: database.get_user_balances(["producer_0001", "consumer_0001"]),
+    "authenticate_user": lambda: database.authenticate_user("admin", "admin123"),
+    "get_chain_tip": lambda: database.get_chain_tip(),
+    "get_block": lambda: database.get_block(1),
+    "get_blocks_after": lambda: database.get_blocks_after(0),
+    "get_trusted_base": lambda: database.get_trusted_base(),
+    "get_unverifiable_block_above": lambda: database.get_unverifiable_block_above(0),
+    "iter_blocks_json": lambda: list(database.iter_blocks_json(0, 10)),
+    "contracts by seller": lambda: database.get_contracts(seller="producer_0001"),
+    "contracts by buyer": lambda: database.get_contracts(buyer="consumer_0001"),
+    "get_open_orders": lambda: database.get_open_orders(),
+    "get_user_orders": lambda: database.get_user_orders("producer_0001"),
+    "get_user_trades": lambda: database.get_user_trades("producer_0001", before=(10, 0)),
+    "get_volume": lambda: database.get_volume("hour"),
+    "get_volume window": lambda: database.get_volume("day", since=0, until=2e9),
+    "submit_mining_job": lambda: database.submit_mining_job("job", "producer_0001"),
+    "claim_mining_job": lambda: database.claim_mining_job(),
+    "get_mining_job": lambda: database.get_mining_job("job"),
+    "/events/poll": lambda: client().get("/events/poll?after=0"),
+    "/pending": lambda: client().get("/pending"),
+    "/transactions": lambda: client().get("/transactions"),
+    "/chain page": lambda: client().get("/chain?after=0&limit=10"),
+    "/users/<name>/trades": lambda: client().get("/users/producer_0001/trades?before=10:0"),
+}
+
+
+# Plan steps that are fine for one hot path, with why
+ALLOWED = {
+    ("get_chain_tip", "SCAN blocks"): "walks the rowid backwards and stops at the first row",
+    ("confirm_transactions", "USE TEMP B-TREE FOR GROUP BY"): "groups only the transactions of one block",
+}
+
+
+def captured_statements(conn, fn):
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        fn()
+    finally:
+        conn.set_trace_callback(None)
+    return [sql for sql in statements if sql.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE", "WITH"))]
+
+
+def plan_problems(conn, name, sql):
+    details = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+    return [d for d in details
+            if ((d.startswith("SCAN") and "USING" not in d and "VIRTUAL TABLE" not in d) or "TEMP B-TREE" in d)
+            and (name, d) not in ALLOWED]
+
+
+@pytest.mark.parametrize("name", HOT_PATHS)
+def test_hot_path_uses_indexes(db, name):
+    seed()
+    statements = captured_statements(db, HOT_PATHS[name])
+    assert statements, f"{name} ran no queries"
+    for sql in statements:
+        assert not plan_problems(db, name, sql), f"{name}: {sql}"